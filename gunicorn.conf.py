@@ -0,0 +1,7 @@
+# gunicorn settings, see the web process in the Procfile.
+
+
+def worker_exit(server, worker):
+    # idle pooled database connections (DB_POOL_SIZE) are closed instead of being dropped with the process
+    from pm.db.pool import close_pools
+    close_pools()
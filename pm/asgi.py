@@ -0,0 +1,66 @@
+"""
+ASGI config for pm project.
+
+It exposes the ASGI callable as a module-level variable named ``application``, e.g. for
+``uvicorn pm.asgi:application``.
+
+Django 2.2 has no ASGI handler of its own, so the WSGI application is run through asgiref. asgiref's
+WsgiToAsgi runs every request of the process on one shared thread (sync_to_async is thread sensitive by
+default since asgiref 3.3); here each request gets a thread of a pool of ASGI_THREADS threads instead, so slow
+views and database calls wait in their own thread. From Django 3.0 on Django's own ASGI handler is used.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pm.settings')
+
+try:
+    from django.core.asgi import get_asgi_application
+except ImportError:  # Django < 3.0
+    from asgiref.sync import SyncToAsync
+    from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+    from django.core.wsgi import get_wsgi_application
+
+    executor = ThreadPoolExecutor(int(os.environ.get('ASGI_THREADS', 10)), thread_name_prefix='asgi')
+
+    class ThreadedWsgiToAsgiInstance(WsgiToAsgiInstance):
+        async def run_wsgi_app(self, body):
+            await SyncToAsync(self.serve, thread_sensitive=False, executor=executor)(body)
+
+        def serve(self, body):
+            # What WsgiToAsgiInstance.run_wsgi_app does in asgiref's shared thread, run in a thread of the pool.
+            # The response is closed as WSGI requires, which ends the request for Django.
+            response = self.wsgi_application(self.build_environ(self.scope, body), self.start_response)
+            try:
+                sent = 0
+                for output in response:
+                    if not self.response_started:
+                        self.response_started = True
+                        self.sync_send(self.response_start)
+                    if self.response_content_length is not None:
+                        output = output[:self.response_content_length - sent]
+                    self.sync_send({'type': 'http.response.body', 'body': output, 'more_body': True})
+                    sent += len(output)
+                    if sent == self.response_content_length:
+                        break
+            finally:
+                if hasattr(response, 'close'):
+                    response.close()
+            if not self.response_started:
+                self.response_started = True
+                self.sync_send(self.response_start)
+            self.sync_send({'type': 'http.response.body'})
+
+    class ThreadedWsgiToAsgi(WsgiToAsgi):
+        async def __call__(self, scope, receive, send):
+            await ThreadedWsgiToAsgiInstance(self.wsgi_application)(scope, receive, send)
+
+    application = ThreadedWsgiToAsgi(get_wsgi_application())
+else:
+    application = get_asgi_application()
+
+
+from tasks.sweeper import start_scheduler  # noqa: E402
+
+start_scheduler()
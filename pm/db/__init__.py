@@ -0,0 +1,10 @@
+# Django's engines and their pooled counterparts in pm.db.backends, see pm.db.pool.
+POOLED_ENGINES = {
+    'django.db.backends.postgresql': 'pm.db.backends.postgresql',
+    'django.db.backends.postgresql_psycopg2': 'pm.db.backends.postgresql',
+    'django.db.backends.sqlite3': 'pm.db.backends.sqlite3',
+}
+
+
+def pooled_engine(engine):
+    return POOLED_ENGINES.get(engine, engine)
@@ -0,0 +1,9 @@
+from django.db.backends.sqlite3 import base
+
+from pm.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def use_pool(self):
+        # close() keeps in-memory databases open, so their connections would never come back to the pool
+        return not self.is_in_memory_db()
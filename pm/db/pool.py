@@ -0,0 +1,187 @@
+import os
+import threading
+from collections import deque
+from time import monotonic, perf_counter
+
+from django.db.utils import OperationalError
+
+from pm.metrics import registry
+
+DEFAULT_POOL = {
+    # open connections per worker process, idle and checked out
+    'MAX_SIZE': 4,
+    # seconds to wait for a free connection before giving up
+    'TIMEOUT': 10,
+    # idle connections older than this are closed instead of reused, before the server or a proxy drops them
+    'MAX_IDLE': 300,
+}
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Database connections of one process for one database. Connections are handed out most recently used first
+    and pass a `SELECT 1` on checkout; a connection that fails it is closed and replaced, so a restarted database
+    costs one failed check per idle connection instead of a failed request.
+    """
+
+    def __init__(self, alias, max_size, timeout, max_idle):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.labels = (('alias', alias),)
+        self.available = threading.Condition()
+        # (connection, returned at)
+        self.idle = deque()
+        self.size = 0
+
+    def acquire(self, connect):
+        self.close_expired()
+        started = perf_counter()
+        deadline = monotonic() + self.timeout
+        while True:
+            with self.available:
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0 or not self.available.wait(remaining):
+                        registry.inc('pm_db_pool_timeouts_total', self.labels)
+                        raise PoolTimeout(f"No free connection in the {self.alias} pool after {self.timeout}s")
+                if self.idle:
+                    connection, returned_at = self.idle.pop()
+                else:
+                    connection, returned_at = None, None
+                    self.size += 1
+            if connection is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    self.forget()
+                    raise
+                registry.inc('pm_db_pool_connections_created_total', self.labels)
+                break
+            if monotonic() - returned_at <= self.max_idle and self.check(connection):
+                break
+            self.discard(connection)
+        registry.inc('pm_db_pool_checkouts_total', self.labels)
+        registry.observe('pm_db_pool_wait_seconds', self.labels, perf_counter() - started)
+        self.report()
+        return connection
+
+    def release(self, connection, discard=False):
+        if not discard:
+            try:
+                # nothing of a transaction left open may leak into the next checkout
+                connection.rollback()
+            except Exception:
+                discard = True
+        if discard:
+            self.discard(connection)
+            return
+        with self.available:
+            self.idle.append((connection, monotonic()))
+            self.available.notify()
+        self.close_expired()
+
+    def check(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            registry.inc('pm_db_pool_health_check_failures_total', self.labels)
+            return False
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        registry.inc('pm_db_pool_connections_closed_total', self.labels)
+        self.forget()
+
+    def forget(self):
+        with self.available:
+            self.size -= 1
+            self.available.notify()
+        self.report()
+
+    def close_expired(self):
+        # Checkouts take the most recently returned connection, so under low concurrency the ones at the other end
+        # would never be looked at again; they are closed here once they have been idle for longer than max_idle.
+        expired = []
+        with self.available:
+            while self.idle and monotonic() - self.idle[0][1] > self.max_idle:
+                expired.append(self.idle.popleft()[0])
+        for connection in expired:
+            self.discard(connection)
+        self.report()
+
+    def close_idle(self):
+        with self.available:
+            idle, self.idle = self.idle, deque()
+        for connection, returned_at in idle:
+            self.discard(connection)
+
+    def report(self):
+        registry.set('pm_db_pool_connections', self.labels, self.size)
+        registry.set('pm_db_pool_idle_connections', self.labels, len(self.idle))
+
+    def stats(self):
+        return {'size': self.size, 'idle': len(self.idle), 'max_size': self.max_size}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict):
+    # One pool per process and database; a forked worker starts with pools of its own.
+    key = (os.getpid(), alias, settings_dict['NAME'], settings_dict['HOST'], settings_dict['PORT'],
+           settings_dict['USER'])
+    with _pools_lock:
+        if key not in _pools:
+            options = dict(DEFAULT_POOL, **settings_dict.get('POOL', {}))
+            _pools[key] = ConnectionPool(alias, options['MAX_SIZE'], options['TIMEOUT'], options['MAX_IDLE'])
+        return _pools[key]
+
+
+def close_pools():
+    # Closes the idle connections of this process, e.g. from the gunicorn worker_exit hook. Pools inherited from
+    # a parent process are left alone, their connections are the parent's.
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if key[0] == pid]
+    for pool in pools:
+        pool.close_idle()
+
+
+class PooledDatabaseWrapperMixin:
+    # Takes connections from the process pool instead of opening them and hands them back on close(). Used with
+    # CONN_MAX_AGE = 0, so every request returns its connection and the pool decides what stays open.
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def use_pool(self):
+        return True
+
+    def get_new_connection(self, conn_params):
+        def connect():
+            return super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params)
+        return self.pool.acquire(connect) if self.use_pool() else connect()
+
+    def _close(self):
+        if not self.use_pool():
+            super()._close()
+        elif self.connection is not None:
+            with self.wrap_database_errors:
+                # a connection closed inside an atomic block is in the middle of a transaction
+                self.pool.release(self.connection, discard=self.in_atomic_block)
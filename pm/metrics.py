@@ -0,0 +1,126 @@
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+logger = logging.getLogger('pm.metrics')
+
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))
+
+    def inc(self, name, labels=(), value=1):
+        with self.lock:
+            self.counters[name, labels] += value
+
+    def set(self, name, labels, value):
+        with self.lock:
+            self.counters[name, labels] = value
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            buckets = self.histograms[name, labels]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+            buckets[-1] += 1
+            self.counters[f"{name}_sum", labels] += value
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{name}{format_labels(labels)} {value:g}")
+            for (name, labels), buckets in sorted(self.histograms.items()):
+                for bound, count in zip(DURATION_BUCKETS + ('+Inf',), buckets):
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {count}")
+                lines.append(f"{name}_count{format_labels(labels)} {buckets[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+registry = MetricsRegistry()
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            self.statements.append((duration, sql))
+
+    def slowest(self, limit):
+        return sorted(self.statements, key=lambda statement: statement[0], reverse=True)[:limit]
+
+
+class QueryMetricsMiddleware:
+    """
+    Records query count, SQL time, the slowest statements and wall time of every request,
+    logs them as one JSON line on the `pm.metrics` logger and aggregates them for /metrics.
+    Enabled with REQUEST_METRICS_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        wall = perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        if view != 'metrics':
+            self.record(request, response, view, recorder, wall)
+        return response
+
+    def record(self, request, response, view, recorder, wall):
+        labels = (('view', view), ('method', request.method))
+        registry.inc('pm_requests_total', labels + (('status', response.status_code),))
+        registry.inc('pm_db_queries_total', labels, recorder.count)
+        registry.inc('pm_db_query_seconds_total', labels, recorder.duration)
+        registry.observe('pm_request_duration_seconds', labels, wall)
+        logger.info(json.dumps({
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'sql_ms': round(recorder.duration * 1000, 2),
+            'wall_ms': round(wall * 1000, 2),
+            'slowest': [{'ms': round(duration * 1000, 2), 'sql': sql}
+                        for duration, sql in recorder.slowest(settings.REQUEST_METRICS_SLOWEST_QUERIES)],
+        }))
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4')
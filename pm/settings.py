@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -92,9 +93,26 @@ DATABASES = {
 
 import dj_database_url
 
+from pm.db import pooled_engine
+
 prod_db = dj_database_url.config(conn_max_age=500)
 DATABASES['default'].update(prod_db)
 
+# DB_POOL_SIZE > 0 switches to the pooled backends of pm.db: up to that many connections per worker process,
+# checked with `SELECT 1` on checkout and returned to the pool at the end of every request.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+
+if DB_POOL_SIZE:
+    DATABASES['default'].update({
+        'ENGINE': pooled_engine(DATABASES['default']['ENGINE']),
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MAX_SIZE': DB_POOL_SIZE,
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'MAX_IDLE': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        },
+    })
+
 AUTH_USER_MODEL = 'tasks.Employee'
 
 # Password validation
@@ -144,6 +162,59 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_PASSWORD')
 
 ADMIN_LOGIN_REDIRECT_URL = '/tasks/task/'
 
+# `offset` uses the default admin paginator, `keyset` pages the task/sprint/project changelists on (created_at, id)
+# and shows an estimated count, see tasks.pagination.
+ADMIN_PAGINATION = os.environ.get('ADMIN_PAGINATION', 'offset')
+
+# `persisted` keeps delay/late in the state columns (written by the sweeper), `computed` derives them in queries.
+OVERDUE_STATUS_MODE = os.environ.get('OVERDUE_STATUS_MODE', 'persisted')
+
+# A file-based cache shared by the worker processes of a host. The cached subordinate sets and /api/options
+# responses are invalidated by model signals in the process that made the change; a local-memory cache would
+# keep serving stale permission data in every other worker. The default directory is in the temporary directory,
+# which starts empty on each deploy of an ephemeral host; CACHE_DIR sets another one.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'pm-cache'),
+    }
+}
+
+# `path` looks up subtrees by the materialized Employee.hierarchy_path, `cte` walks chief_id with one
+# WITH RECURSIVE query (PostgreSQL, SQLite), see tasks.models.EmployeeManager.
+HIERARCHY_BACKEND = os.environ.get('HIERARCHY_BACKEND', 'path')
+
+HIERARCHY_CACHE_TIMEOUT = int(os.environ.get('HIERARCHY_CACHE_TIMEOUT', 60 * 60))
+
+# Per-request query count / SQL time / wall time logging and the /metrics endpoint (pm.metrics).
+REQUEST_METRICS_ENABLED = os.environ.get('REQUEST_METRICS_ENABLED', '') == '1'
+REQUEST_METRICS_SLOWEST_QUERIES = 5
+
+if REQUEST_METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'pm.metrics.QueryMetricsMiddleware')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'pm.metrics': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'tasks': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# Overdue sweeper (tasks.sweeper): seconds between in-process sweeps, 0 disables the scheduler.
+OVERDUE_SWEEP_INTERVAL = int(os.environ.get('OVERDUE_SWEEP_INTERVAL', 0))
+OVERDUE_SWEEP_BATCH_SIZE = int(os.environ.get('OVERDUE_SWEEP_BATCH_SIZE', 500))
+
+# Change feed (tasks.changes): rows saved in the last CHANGE_FEED_DELAY seconds are held back until their
+# transactions have committed. Keep it above the longest request or sweep batch.
+CHANGE_FEED_DELAY = float(os.environ.get('CHANGE_FEED_DELAY', 5))
+# Bearer token of the mirrors that may read /api/changes, the feed is off without one.
+CHANGE_FEED_TOKEN = os.environ.get('CHANGE_FEED_TOKEN', '')
+
 USE_L10N = False
 DATE_FORMAT = 'd-m-Y'
 DATETIME_FORMAT = 'd-m-Y H:i'
@@ -13,13 +13,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.conf.urls import url
 from django.contrib import admin
 from django.http import HttpResponseRedirect
 from django.urls import path, include
 
+from pm.metrics import metrics_view
+
 urlpatterns = [
     url('^$', lambda r: HttpResponseRedirect('tasks')),
     url('^', admin.site.urls),
     url('^api/', include('tasks.urls', namespace='api'))
 ]
+
+if settings.REQUEST_METRICS_ENABLED:
+    urlpatterns.insert(0, url('^metrics$', metrics_view, name='metrics'))
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pm.settings')
 
 application = get_wsgi_application()
+
+
+from tasks.sweeper import start_scheduler  # noqa: E402
+
+start_scheduler()
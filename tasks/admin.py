@@ -1,19 +1,33 @@
-from datetime import datetime, date
+import codecs
 
 from adminfilters.multiselect import UnionFieldListFilter
-from django.contrib import admin, auth
+from django.contrib import admin, auth, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ERROR_FLAG, SEARCH_VAR
+from django.core.exceptions import PermissionDenied
 from django.core.mail import send_mail
-from django.db import models
+from django.db import connections, models
 from django.forms import Textarea, CheckboxSelectMultiple
 from django import forms
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils import timezone
 
 from pm.settings import email, EMAIL_HOST_USER
-from .filters import EmployeeFilter, ProjectFilter, SprintFilter, RoleFilter
-from .forms import TaskForm, SprintForm, ProjectForm
-from .lib import PmPermissionMixin, get_employee_tasks, get_employee_subordinates, delay_tasks, delay_sprints, \
-    delay_projects
+from .filters import EmployeeFilter, ProjectFilter, SprintFilter, RoleFilter, EffectiveStatusFilter, \
+    EffectiveStateFilter
+from .forms import TaskForm, SprintForm, ProjectForm, TaskActionForm, TaskImportForm
+from .cache import bump_versions, project_scope
+from .lib import PmPermissionMixin, computed_status_mode, get_employee_projects, get_employee_tasks, \
+    get_subordinate_ids, get_subordinate_rows
 from .models import Task, Item, Employee, Project, Sprint, Dates
+from .pagination import KeysetPaginationMixin
+from .rollups import recompute_rollups, task_locations
+from .reports import csv_report, report_formats, xlsx_report
+from .search import search_available, search_tasks
+from .transfer import TaskImporter, export_lines, export_records, read_records
 from django_admin_listfilter_dropdown.filters import RelatedDropdownFilter
 
 
@@ -24,24 +38,83 @@ class ItemInline(admin.TabularInline):
     fields = ('item_description', 'is_done')
 
     def has_add_permission(self, request, obj=None):
-        if obj and obj.employee == request.user:
+        if obj and obj.employee_id == request.user.pk:
             return False
         return True
 
     def get_readonly_fields(self, request, obj=None):
-        if obj and obj.employee == request.user:
+        if obj and obj.employee_id == request.user.pk:
             return ('item_description',)
         else:
             return super(ItemInline, self).get_readonly_fields(request, obj)
 
     def has_delete_permission(self, request, obj=None):
-        if obj and obj.employee == request.user:
+        if obj and obj.employee_id == request.user.pk:
             return False
         return True
 
 
-class ProjectAdmin(admin.ModelAdmin, PmPermissionMixin):
-    list_display = ('title', 'created_at', 'date_start', 'status', 'redline', 'date_end', 'last_modified')
+def effective_status_column(model, status_field):
+    field = model._meta.get_field(status_field)
+    choices = dict(field.choices)
+
+    def column(obj):
+        return choices.get(getattr(obj, f"effective_{status_field}"))
+
+    column.short_description = field.verbose_name
+    column.admin_order_field = f"effective_{status_field}"
+    return column
+
+
+def progress_column(done_field, total_field, description):
+    # read from the rollup counters on the row itself, so the column costs no queries
+    def column(obj):
+        return f"{getattr(obj, done_field)}/{getattr(obj, total_field)}"
+
+    column.short_description = description
+    column.admin_order_field = done_field
+    return column
+
+
+tasks_progress = progress_column('tasks_done', 'tasks_total', "Tasks done")
+items_progress = progress_column('items_done', 'items_total', "Items done")
+
+
+class EffectiveStatusAdminMixin:
+    # In the `computed` status mode the changelist shows, sorts and filters by the overdue-aware status
+    # annotated in get_queryset instead of the stored column.
+    status_field = 'status'
+    status_filter = EffectiveStatusFilter
+    # Rollup counters of the stored delay/late states, which are not written in the `computed` mode.
+    stored_overdue_columns = ('tasks_delay', 'tasks_late')
+
+    def get_list_display(self, request):
+        list_display = super().get_list_display(request)
+        if computed_status_mode():
+            column = effective_status_column(self.model, self.status_field)
+            list_display = tuple(column if f == self.status_field else f for f in list_display
+                                 if f not in self.stored_overdue_columns)
+        return list_display
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if computed_status_mode():
+            stored = (self.status_field, (self.status_field, UnionFieldListFilter))
+            list_filter = tuple(self.status_filter if f in stored else f for f in list_filter)
+        return list_filter
+
+    def current_status(self, obj):
+        # The change form keeps the stored status, so that saving it does not persist an overdue state the dates
+        # no longer warrant; the overdue-aware one is shown next to it.
+        field = self.model._meta.get_field(self.status_field)
+        return dict(field.choices).get(getattr(obj, f"get_effective_{self.status_field}")())
+
+    current_status.short_description = "Current status"
+
+
+class ProjectAdmin(KeysetPaginationMixin, EffectiveStatusAdminMixin, admin.ModelAdmin, PmPermissionMixin):
+    list_display = ('title', 'created_at', 'date_start', 'status', 'redline', 'date_end', tasks_progress, 'tasks_delay',
+                    'tasks_late', items_progress, 'last_modified')
     list_display_links = ('title',)
     search_fields = ('title', 'status')
 
@@ -55,10 +128,10 @@ class ProjectAdmin(admin.ModelAdmin, PmPermissionMixin):
     form = ProjectForm
 
     ordering = ('-created_at',)
-    readonly_fields = ('created_at', 'last_modified', 'created_by')
+    readonly_fields = ('created_at', 'last_modified', 'created_by', 'current_status')
 
     fieldsets = (  # Edition form
-        (None, {'fields': ('title', 'short_name', 'date_start', 'redline', 'date_end', 'status',
+        (None, {'fields': ('title', 'short_name', 'date_start', 'redline', 'date_end', ('status', 'current_status'),
                            'employees')}),
         ("Additional information", {'fields': (('created_at', 'last_modified'), 'created_by'), 'classes': ('collapse',)}),
     )
@@ -86,23 +159,11 @@ class ProjectAdmin(admin.ModelAdmin, PmPermissionMixin):
         super().save_model(request, obj, form, change)
 
     def get_queryset(self, request):
-        delay_projects()
         queryset = Project.objects.filter(created_by=request.user)
+        if computed_status_mode():
+            queryset = queryset.with_effective_status()
         return queryset
 
-    def render_change_form(self, request, context, *args, **kwargs):
-        if kwargs['obj']:
-            if kwargs['obj'].redline and \
-                    kwargs['obj'].status in ('open', 'in_progress') and \
-                    kwargs['obj'].redline <= date.today():
-                kwargs['obj'].status = 'delay'
-                kwargs['obj'].save()
-            elif kwargs['obj'].status in ('open', 'in_progress', 'delay') and \
-                    kwargs['obj'].date_end <= date.today():
-                kwargs['obj'].status = 'late'
-                kwargs['obj'].save()
-        return super(ProjectAdmin, self).render_change_form(request, context, *args, **kwargs)
-
     def has_module_permission(self, request):
         return self.only_for_pm(request)
 
@@ -116,9 +177,11 @@ class ProjectAdmin(admin.ModelAdmin, PmPermissionMixin):
         return self.only_for_pm(request)
 
 
-class SprintAdmin(admin.ModelAdmin, PmPermissionMixin):
-    list_display = ('project', 'title', 'created_at', 'date_start', 'status', 'redline', 'date_end', 'last_modified')
+class SprintAdmin(KeysetPaginationMixin, EffectiveStatusAdminMixin, admin.ModelAdmin, PmPermissionMixin):
+    list_display = ('project', 'title', 'created_at', 'date_start', 'status', 'redline', 'date_end', tasks_progress,
+                    'tasks_delay', 'tasks_late', items_progress, 'last_modified')
     list_display_links = ('title',)
+    list_select_related = ('project',)
     search_fields = ('title', 'status')
 
     list_filter = (
@@ -131,11 +194,11 @@ class SprintAdmin(admin.ModelAdmin, PmPermissionMixin):
     form = SprintForm
 
     ordering = ('-created_at',)
-    readonly_fields = ('created_at', 'last_modified', 'created_by')
+    readonly_fields = ('created_at', 'last_modified', 'created_by', 'current_status')
 
     fieldsets = (  # Edition form
         (None, {'fields': ('project', 'title', 'date_start', 'redline', 'date_end',
-                           'status')}),
+                           ('status', 'current_status'))}),
         ("Additional information", {'fields': (('created_at', 'last_modified'), 'created_by'), 'classes': ('collapse',)}),
     )
 
@@ -157,19 +220,6 @@ class SprintAdmin(admin.ModelAdmin, PmPermissionMixin):
         return fieldsets
 
     def render_change_form(self, request, context, *args, **kwargs):
-        if kwargs['obj']:
-            print(kwargs['obj'].redline)
-            print(kwargs['obj'].date_end)
-            print(date.today())
-            if kwargs['obj'].redline and \
-                    kwargs['obj'].status in ('open', 'in_progress') and \
-                    kwargs['obj'].redline <= date.today():
-                kwargs['obj'].status = 'delay'
-                kwargs['obj'].save()
-            elif kwargs['obj'].status in ('open', 'in_progress', 'delay') and \
-                    kwargs['obj'].date_end <= date.today():
-                kwargs['obj'].status = 'late'
-                kwargs['obj'].save()
         context['adminform'].form.fields['project'].queryset = request.user.created_projects.all()
         return super(SprintAdmin, self).render_change_form(request, context, *args, **kwargs)
 
@@ -179,8 +229,9 @@ class SprintAdmin(admin.ModelAdmin, PmPermissionMixin):
         super().save_model(request, obj, form, change)
 
     def get_queryset(self, request):
-        delay_sprints()
         queryset = Sprint.objects.filter(created_by=request.user)
+        if computed_status_mode():
+            queryset = queryset.with_effective_status()
         return queryset
 
     def has_module_permission(self, request):
@@ -196,10 +247,15 @@ class SprintAdmin(admin.ModelAdmin, PmPermissionMixin):
         return self.only_for_pm(request)
 
 
-class TaskAdmin(admin.ModelAdmin):
+class TaskAdmin(KeysetPaginationMixin, EffectiveStatusAdminMixin, admin.ModelAdmin):
+    status_field = 'state'
+    status_filter = EffectiveStateFilter
+
     list_display = (
         'number', 'title', 'project', 'sprint', 'employee', 'created_at', 'redline', 'deadline', 'priority', 'state')
     list_display_links = ('number', 'title')
+    list_select_related = ('project', 'sprint__project', 'employee')
+    # used only where the full-text index is not available, see get_search_results
     search_fields = ('id', 'title',
                      'employee__name', 'priority', 'state')
     list_filter = (
@@ -216,9 +272,11 @@ class TaskAdmin(admin.ModelAdmin):
     # filter_horizontal = ('sub_tasks',)
 
     ordering = ('-created_at',)
-    readonly_fields = ['created_at', 'last_modified', 'created_by']
+    readonly_fields = ['created_at', 'last_modified', 'created_by', 'current_status']
 
     inlines = [ItemInline]
+    action_form = TaskActionForm
+    actions = ['set_state', 'set_priority', 'assign_employee', 'move_to_sprint', 'export_jsonl', 'export_csv']
     formfield_overrides = {
         models.TextField: {
             'widget': Textarea(attrs={'rows': 4, 'cols': 32})
@@ -238,8 +296,8 @@ class TaskAdmin(admin.ModelAdmin):
         else:
             fieldsets = (  # Edition form
                 (None,
-                 {'fields': ['project', 'sprint', 'title', 'description', 'state', 'priority', 'employee', 'redline',
-                             'deadline',
+                 {'fields': ['project', 'sprint', 'title', 'description', ('state', 'current_status'), 'priority',
+                             'employee', 'redline', 'deadline',
                              'sub_tasks']}),
                 ("Additional information",
                  {'fields': (('created_at', 'last_modified'), 'created_by'), 'classes': ('collapse',)}),
@@ -252,7 +310,7 @@ class TaskAdmin(admin.ModelAdmin):
 
     def get_list_display(self, request):
         if request.user.role in ('dev', 'qa', 'analyst'):
-            fields = list(self.list_display)
+            fields = list(super(TaskAdmin, self).get_list_display(request))
             fields.remove('deadline')
             return tuple(fields)
         else:
@@ -273,42 +331,47 @@ class TaskAdmin(admin.ModelAdmin):
         #                   EMAIL_HOST_USER, [obj.employee.email])
 
     def get_readonly_fields(self, request, obj=None):
-        if obj and obj.employee == request.user:
-            print(self.readonly_fields)
+        if obj and obj.employee_id == request.user.pk:
             return tuple(self.readonly_fields) + (
                 'project', 'sprint', 'title', 'description', 'employee', 'deadline', 'priority', 'redline')
         else:
             return super(TaskAdmin, self).get_readonly_fields(request, obj)
 
+    def full_text_search(self, request):
+        if not hasattr(request, '_full_text_search'):
+            request._full_text_search = search_available(connections[self.model.objects.db])
+        return request._full_text_search
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term and self.full_text_search(request):
+            return search_tasks(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
+    def get_ordering(self, request):
+        # best matches first unless a column is sorted explicitly
+        if request.GET.get(SEARCH_VAR) and self.full_text_search(request):
+            return ('-search_rank',) + tuple(self.ordering)
+        return super().get_ordering(request)
+
     def get_queryset(self, request):
-        delay_tasks()
-        task_ids = [task.id for task in get_employee_tasks(request.user)]
-        return Task.objects.filter(id__in=task_ids)
+        queryset = get_employee_tasks(request.user)
+        if computed_status_mode():
+            queryset = queryset.with_effective_state()
+        return queryset
 
     def render_change_form(self, request, context, *args, **kwargs):
-        if not kwargs['obj'] in request.user.tasks_assigned.all():
-            context['adminform'].form.fields['project'].queryset = request.user.employee_projects.all().union(
-                request.user.created_projects.all())
+        if not (kwargs['obj'] and kwargs['obj'].employee_id == request.user.pk):
+            context['adminform'].form.fields['project'].queryset = get_employee_projects(request.user)
             if kwargs['obj']:
-                print(timezone.now())
-                print(kwargs['obj'].redline)
-                if kwargs['obj'].state in ('to-do', 'in_progress', 'postponed') and kwargs[
-                    'obj'].redline <= timezone.now():
-                    kwargs['obj'].state = 'delay'
-                    kwargs['obj'].save()
-                elif kwargs['obj'].state in ('to-do', 'in_progress', 'postponed', 'delay') and kwargs[
-                    'obj'].deadline <= timezone.now():
-                    kwargs['obj'].state = 'late'
-                    kwargs['obj'].save()
-                project_tasks = kwargs['obj'].project.project_tasks.all()
-                tasks = project_tasks.filter(
-                    id__in=[task.id for task in get_employee_tasks(request.user, include_self=False)])
+                tasks = get_employee_tasks(request.user, include_self=False).filter(
+                    project_id=kwargs['obj'].project_id).select_related('project', 'employee')
 
                 project_employees = kwargs['obj'].project.employees.all()
                 employees = project_employees.filter(
-                    id__in=[e.id for e in get_employee_subordinates(request.user, include_self=False)])
+                    id__in=get_subordinate_ids(request.user))
 
-                context['adminform'].form.fields['sprint'].queryset = kwargs['obj'].project.project_sprints.all()
+                sprints = kwargs['obj'].project.project_sprints.select_related('project')
+                context['adminform'].form.fields['sprint'].queryset = sprints
                 context['adminform'].form.fields['employee'].queryset = employees
                 context['adminform'].form.fields['sub_tasks'].queryset = tasks
 
@@ -320,34 +383,165 @@ class TaskAdmin(admin.ModelAdmin):
                 # id__in=[task.id for task in get_employee_tasks(request.user, include_self=False)])
                 context['adminform'].form.fields['sprint'].queryset = Sprint.objects.none()
         else:
-            if kwargs['obj'].state in ('to-do', 'in_progress', 'postponed') and kwargs[
-                'obj'].redline <= timezone.now():
-                kwargs['obj'].state = 'delay'
-                kwargs['obj'].save()
-            elif kwargs['obj'].state in ('to-do', 'in_progress', 'postponed', 'delay') and kwargs[
-                'obj'].deadline <= timezone.now():
-                kwargs['obj'].state = 'late'
-                kwargs['obj'].save()
-            project_tasks = kwargs['obj'].project.project_tasks.all()
-            tasks = project_tasks.filter(
-                id__in=[task.id for task in get_employee_tasks(request.user, include_self=False)])
+            tasks = get_employee_tasks(request.user, include_self=False).filter(
+                project_id=kwargs['obj'].project_id).select_related('project', 'employee')
             context['adminform'].form.fields['sub_tasks'].queryset = tasks
         return super(TaskAdmin, self).render_change_form(request, context, *args, **kwargs)
 
     def has_add_permission(self, request):
-        if get_employee_subordinates(request.user):
+        if get_subordinate_ids(request.user):
+            return True
+        return False
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='tasks_task_import'),
+            path('report.<format>', self.admin_site.admin_view(self.report_view), name='tasks_task_report'),
+        ] + super().get_urls()
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = dict(extra_context or {}, report_formats=report_formats())
+        response = super().changelist_view(request, extra_context)
+        action_form = getattr(response, 'context_data', {}).get('action_form')
+        if action_form:
+            # the same choices as the employee and sprint filters, so no extra queries
+            blank = [('', '---------')]
+            action_form.fields['employee'].widget.choices = blank + [
+                (pk, name) for pk, name, role in get_subordinate_rows(request.user) if pk != request.user.pk]
+            action_form.fields['sprint'].widget.choices = blank + SprintFilter.choices_for(request)
+        return response
+
+    def report_view(self, request, format):
+        # The changelist as currently filtered, searched and sorted, streamed in chunks.
+        if format not in report_formats():
+            raise Http404
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        try:
+            queryset = self.get_changelist_instance(request).get_queryset(request)
+        except IncorrectLookupParameters:
+            return redirect(reverse('admin:tasks_task_changelist') + f'?{ERROR_FLAG}=1')
+        if format == 'xlsx':
+            return FileResponse(xlsx_report(queryset), as_attachment=True, filename='tasks.xlsx')
+        response = StreamingHttpResponse(csv_report(queryset), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="tasks.csv"'
+        return response
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = TaskImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            importer = TaskImporter(user=request.user)
+            counts = importer.run(read_records(codecs.iterdecode(upload, 'utf-8'),
+                                               'csv' if upload.name.endswith('.csv') else 'jsonl'))
+            self.message_user(request, f"Imported {counts['task']} tasks, {counts['item']} items and "
+                                       f"{counts['sub_task']} sub_task links")
+            for line, error in importer.errors[:20]:
+                self.message_user(request, f"Line {line} skipped: {error}", messages.WARNING)
+            if len(importer.errors) > 20:
+                self.message_user(request, f"{len(importer.errors) - 20} more records skipped", messages.WARNING)
+            return redirect('admin:tasks_task_changelist')
+        context = dict(self.admin_site.each_context(request), opts=self.model._meta, form=form, title="Import tasks")
+        return TemplateResponse(request, 'admin/tasks/task/import.html', context)
+
+    def export_tasks(self, queryset, format):
+        response = StreamingHttpResponse(export_lines(export_records(queryset), format),
+                                         content_type='text/csv' if format == 'csv' else 'application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="tasks.{format}"'
+        return response
+
+    def action_value(self, request, name):
+        form = self.action_form(request.POST)
+        form.is_valid()
+        return form.cleaned_data.get(name)
+
+    def update_tasks(self, request, queryset, **values):
+        # One UPDATE for the whole selection. It sends no signals, so the caches of the projects are bumped and
+        # the progress rollups recounted here.
+        sprints, projects = task_locations(queryset)
+        updated = queryset.update(last_modified=timezone.now(), **values)
+        bump_versions(*map(project_scope, projects))
+        if 'state' in values or 'sprint' in values:
+            recompute_rollups(sprints | {getattr(values.get('sprint'), 'pk', None)}, projects)
+        self.message_user(request, f"Updated {updated} tasks")
+
+    def reject_own_tasks(self, request, queryset):
+        # The assignee of a task may only change its state, see get_readonly_fields.
+        if queryset.filter(employee_id=request.user.pk).exists():
+            self.message_user(request, "Tasks assigned to you can only change their status", messages.ERROR)
             return True
         return False
 
+    def set_state(self, request, queryset):
+        state = self.action_value(request, 'state')
+        if not state:
+            self.message_user(request, "Choose a status", messages.ERROR)
+            return
+        self.update_tasks(request, queryset, state=state)
+
+    set_state.short_description = "Set status of selected tasks"
+
+    def set_priority(self, request, queryset):
+        priority = self.action_value(request, 'priority')
+        if not priority:
+            self.message_user(request, "Choose a priority", messages.ERROR)
+            return
+        if not self.reject_own_tasks(request, queryset):
+            self.update_tasks(request, queryset, priority=priority)
+
+    set_priority.short_description = "Set priority of selected tasks"
+
+    def assign_employee(self, request, queryset):
+        employee_id = self.action_value(request, 'employee')
+        if employee_id is None or employee_id not in get_subordinate_ids(request.user):
+            self.message_user(request, "Choose one of your subordinates", messages.ERROR)
+            return
+        if self.reject_own_tasks(request, queryset):
+            return
+        if queryset.exclude(project__employees=employee_id).exists():
+            self.message_user(request, "The employee is not a member of every selected task's project", messages.ERROR)
+            return
+        self.update_tasks(request, queryset, employee_id=employee_id)
+
+    assign_employee.short_description = "Assign selected tasks"
+
+    def move_to_sprint(self, request, queryset):
+        sprint_id = self.action_value(request, 'sprint')
+        sprint = Sprint.objects.filter(pk=sprint_id, project__in=get_employee_projects(request.user)).first() \
+            if sprint_id is not None else None
+        if sprint is None:
+            self.message_user(request, "Choose a sprint of your projects", messages.ERROR)
+            return
+        if self.reject_own_tasks(request, queryset):
+            return
+        if queryset.exclude(project_id=sprint.project_id).exists():
+            self.message_user(request, "Every selected task has to belong to the sprint's project", messages.ERROR)
+            return
+        self.update_tasks(request, queryset, sprint=sprint)
+
+    move_to_sprint.short_description = "Move selected tasks to sprint"
+
+    def export_jsonl(self, request, queryset):
+        return self.export_tasks(queryset, 'jsonl')
+
+    export_jsonl.short_description = "Export selected tasks (JSON lines)"
+
+    def export_csv(self, request, queryset):
+        return self.export_tasks(queryset, 'csv')
+
+    export_csv.short_description = "Export selected tasks (CSV)"
+
     def has_change_permission(self, request, obj=None):
-        if obj and obj.employee == request.user:
+        if obj and obj.employee_id == request.user.pk:
             return True
-        elif get_employee_subordinates(request.user):
+        elif get_subordinate_ids(request.user):
             return True
         return False
 
     def has_delete_permission(self, request, obj=None):
-        if obj and obj.employee == request.user:
+        if obj and obj.employee_id == request.user.pk:
             return False
         return True
 
@@ -0,0 +1,206 @@
+from collections import defaultdict
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+
+from tasks.lib import computed_status_mode, get_employee_tasks
+from tasks.models import Project, Sprint, Task
+from tasks.pagination import decode_cursor, encode_cursor
+from tasks.rollups import ROLLUP_FIELDS
+
+API_PAGE_SIZE = 100
+# largest page and largest batch of ids
+API_MAX_PAGE_SIZE = 500
+
+
+class ApiError(ValueError):
+    pass
+
+
+class Resource:
+    """
+    A read-only collection of the API. `columns()` maps the public field names to what is selected for them, so
+    a page is read with one values_list() query, plus one query per requested many-to-many field in `links`
+    (field -> through model, column of this model, column of the linked model).
+    """
+    links = {}
+
+    def get_queryset(self, employee):
+        # the rows visible to `employee`, all rows without one
+        raise NotImplementedError
+
+    def columns(self):
+        raise NotImplementedError
+
+    def parse_fields(self, value):
+        columns = self.columns()
+        available = list(columns) + list(self.links)
+        if not value:
+            return available
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in available]
+        if unknown:
+            raise ApiError(f"Unknown fields {', '.join(unknown)}, choose from {', '.join(available)}")
+        return fields
+
+    def read(self, employee, params):
+        fields = self.parse_fields(params.get('fields'))
+        queryset = self.get_queryset(employee)
+        if params.get('ids'):
+            rows = self.fetch(queryset.filter(pk__in=parse_ids(params['ids'])).order_by('pk'), fields)
+            return {'results': [result for result, extra in rows], 'next_cursor': None}
+
+        limit = parse_limit(params.get('limit'))
+        rows = self.fetch(page(queryset, params.get('cursor'))[:limit + 1], fields, 'created_at')
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            pk, created_at = rows[-1][1]
+            next_cursor = encode_cursor('next', created_at, pk)
+        return {'results': [result for result, extra in rows], 'next_cursor': next_cursor}
+
+    def fetch(self, queryset, fields, *extra):
+        # (result, (pk, *extra values)) for each row of `queryset`
+        columns = self.columns()
+        selected = [field for field in fields if field in columns]
+        rows = [(dict(zip(selected, row)), row[len(selected):])
+                for row in queryset.values_list(*[columns[field] for field in selected], 'pk', *extra)]
+        for field in fields:
+            if field in self.links:
+                linked = self.load_links(field, [extra[0] for result, extra in rows])
+                for result, extra in rows:
+                    result[field] = linked.get(extra[0], [])
+        return rows
+
+    def load_links(self, field, pks):
+        through, column, other = self.links[field]
+        linked = defaultdict(list)
+        if pks:
+            links = through.objects.filter(**{f'{column}__in': pks}).order_by(other).values_list(column, other)
+            for pk, other_pk in links:
+                linked[pk].append(other_pk)
+        return linked
+
+
+class TaskResource(Resource):
+    links = {'sub_tasks': (Task.sub_tasks.through, 'from_task_id', 'to_task_id')}
+
+    def get_queryset(self, employee):
+        # the visibility of TaskAdmin.get_queryset
+        queryset = get_employee_tasks(employee) if employee else Task.objects.all()
+        if computed_status_mode():
+            queryset = queryset.with_effective_state()
+        return queryset
+
+    def columns(self):
+        return {
+            'id': 'pk',
+            'number': Concat('project__short_name', Value('-'), Cast('pk', CharField())),
+            'title': 'title',
+            'description': 'description',
+            'accept_criterion': 'accept_criterion',
+            'project': 'project_id',
+            'sprint': 'sprint_id',
+            'employee': 'employee_id',
+            'created_by': 'created_by_id',
+            'state': 'effective_state' if computed_status_mode() else 'state',
+            'priority': 'priority',
+            'redline': 'redline',
+            'deadline': 'deadline',
+            'created_at': 'created_at',
+            'last_modified': 'last_modified',
+        }
+
+
+class SprintResource(Resource):
+    def get_queryset(self, employee):
+        queryset = managed_by(Sprint.objects.all(), employee)
+        if computed_status_mode():
+            queryset = queryset.with_effective_status()
+        return queryset
+
+    def columns(self):
+        columns = {
+            'id': 'pk',
+            'project': 'project_id',
+            'title': 'title',
+            'date_start': 'date_start',
+            'redline': 'redline',
+            'date_end': 'date_end',
+            'status': 'effective_status' if computed_status_mode() else 'status',
+            'created_by': 'created_by_id',
+            'created_at': 'created_at',
+            'last_modified': 'last_modified',
+        }
+        columns.update((field, field) for field in ROLLUP_FIELDS)
+        return columns
+
+
+class ProjectResource(Resource):
+    links = {'employees': (Project.employees.through, 'project_id', 'employee_id')}
+
+    def get_queryset(self, employee):
+        queryset = managed_by(Project.objects.all(), employee)
+        if computed_status_mode():
+            queryset = queryset.with_effective_status()
+        return queryset
+
+    def columns(self):
+        columns = {
+            'id': 'pk',
+            'title': 'title',
+            'short_name': 'short_name',
+            'date_start': 'date_start',
+            'redline': 'redline',
+            'date_end': 'date_end',
+            'status': 'effective_status' if computed_status_mode() else 'status',
+            'created_by': 'created_by_id',
+            'created_at': 'created_at',
+            'last_modified': 'last_modified',
+        }
+        columns.update((field, field) for field in ROLLUP_FIELDS)
+        return columns
+
+
+def managed_by(queryset, employee):
+    # the visibility of SprintAdmin and ProjectAdmin: project managers see what they created, others nothing
+    if employee is None:
+        return queryset
+    if employee.role != 'pm':
+        return queryset.none()
+    return queryset.filter(created_by=employee)
+
+
+def parse_ids(value):
+    try:
+        ids = {int(pk) for pk in value.split(',') if pk.strip()}
+    except ValueError:
+        raise ApiError(f"Invalid ids {value!r}")
+    if len(ids) > API_MAX_PAGE_SIZE:
+        raise ApiError(f"At most {API_MAX_PAGE_SIZE} ids at a time")
+    return ids
+
+
+def parse_limit(value):
+    try:
+        limit = int(value) if value else API_PAGE_SIZE
+    except ValueError:
+        raise ApiError(f"Invalid limit {value!r}")
+    if not 0 < limit <= API_MAX_PAGE_SIZE:
+        raise ApiError(f"limit must be between 1 and {API_MAX_PAGE_SIZE}")
+    return limit
+
+
+def page(queryset, cursor):
+    # newest first, on (created_at, id) like the keyset paginated changelists
+    queryset = queryset.order_by('-created_at', '-pk')
+    if not cursor:
+        return queryset
+    try:
+        direction, created_at, pk = decode_cursor(cursor)
+    except IncorrectLookupParameters as e:
+        raise ApiError(str(e))
+    if direction != 'next':
+        raise ApiError(f"Invalid cursor {cursor!r}")
+    return queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, pk__gte=pk)
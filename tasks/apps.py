@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
 
 
 class TasksConfig(AppConfig):
     name = 'tasks'
     verbose_name = 'Project Management'
+
+    def ready(self):
+        from tasks import signals  # noqa: F401
+        post_migrate.connect(restore_search_triggers, sender=self)
+
+
+def restore_search_triggers(using, **kwargs):
+    from tasks.search import restore_search_triggers
+    restore_search_triggers(connections[using])
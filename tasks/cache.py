@@ -0,0 +1,77 @@
+from hashlib import md5
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from pm.metrics import registry
+
+OPTIONS_TIMEOUT = 60 * 60
+
+HIERARCHY = 'hierarchy'
+
+
+def project_scope(project_id):
+    if project_id is not None:
+        return f"project:{project_id}"
+
+
+def get_versions(*scopes):
+    # Cached values embed the versions of the scopes they depend on; bumping a version makes
+    # every key built from the old one unreachable, so there is nothing to delete.
+    keys = [f"version:{scope}" for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*scopes):
+    cache.set_many({f"version:{scope}": uuid4().hex for scope in scopes if scope}, None)
+
+
+def options_cache_key(request, project_id):
+    if not hasattr(request, '_options_cache_key'):
+        versions = get_versions(project_scope(project_id), HIERARCHY)
+        request._options_cache_key = f"options:{request.user.pk}:{project_id}:{':'.join(versions)}"
+    return request._options_cache_key
+
+
+def options_etag(request):
+    project_id = request.GET.get('id', '')
+    if project_id and request.user.is_authenticated:
+        return md5(options_cache_key(request, project_id).encode()).hexdigest()
+
+
+def subordinates_key(employee_id):
+    return f"hierarchy:subordinates:{employee_id}"
+
+
+def get_cached_subordinate_rows(employee_id, load):
+    key = subordinates_key(employee_id)
+    rows = cache.get(key)
+    if rows is None:
+        registry.inc('pm_hierarchy_cache_requests_total', (('result', 'miss'),))
+        rows = load()
+        cache.set(key, rows, settings.HIERARCHY_CACHE_TIMEOUT)
+    else:
+        registry.inc('pm_hierarchy_cache_requests_total', (('result', 'hit'),))
+    return rows
+
+
+def invalidate_subordinates(*paths):
+    # A change to an employee only affects the cached subtrees of the employees on its hierarchy path,
+    # i.e. itself and its chiefs up to the top, before and after the change.
+    ids = {pk for path in paths if path for pk in path.strip('/').split('/')}
+    cache.delete_many([subordinates_key(pk) for pk in ids])
+
+
+def parent_path(path):
+    return path[:path.rstrip('/').rfind('/') + 1] if path else path
+
+
+def hierarchy_cache_stats():
+    return {result: int(registry.counters.get(('pm_hierarchy_cache_requests_total', (('result', result),)), 0))
+            for result in ('hit', 'miss')}
@@ -0,0 +1,94 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from tasks.api import API_PAGE_SIZE, ApiError, ProjectResource, SprintResource, TaskResource
+from tasks.models import Project, Sprint, Task, Tombstone
+
+# Changes are ordered by (timestamp, kind, id); deletions come last among changes of the same moment.
+FEED = (('project', ProjectResource()), ('sprint', SprintResource()), ('task', TaskResource()))
+DELETED = len(FEED)
+
+TOMBSTONE_MODELS = {Project: 'project', Sprint: 'sprint', Task: 'task'}
+
+
+def record_deletion(instance, using):
+    Tombstone.objects.using(using).create(model=TOMBSTONE_MODELS[type(instance)], object_id=instance.pk)
+
+
+def touch(model, pks, using):
+    # Many-to-many changes do not save the rows they link, so the feed would miss them.
+    model.objects.using(using).filter(pk__in=pks).update(last_modified=timezone.now())
+
+
+def encode_position(position):
+    modified, kind, pk = position
+    return urlsafe_b64encode(json.dumps([modified.isoformat(), kind, pk]).encode()).decode()
+
+
+def decode_position(value):
+    try:
+        modified, kind, pk = json.loads(urlsafe_b64decode(value.encode()).decode())
+        modified = parse_datetime(modified)
+    except (Base64Error, TypeError, ValueError):
+        raise ApiError(f"Invalid cursor {value!r}")
+    if modified is None or not isinstance(kind, int) or not isinstance(pk, int):
+        raise ApiError(f"Invalid cursor {value!r}")
+    return modified, kind, pk
+
+
+def after(queryset, field, kind, position):
+    # rows of `kind` whose (field, kind, id) comes after `position`
+    if position is None:
+        return queryset
+    modified, position_kind, pk = position
+    later = Q(**{f'{field}__gt': modified})
+    if kind > position_kind:
+        later |= Q(**{field: modified})
+    elif kind == position_kind:
+        later |= Q(**{field: modified, 'pk__gt': pk})
+    return queryset.filter(later)
+
+
+def read_changes(cursor=None, limit=API_PAGE_SIZE):
+    """
+    Tasks, sprints and projects saved after `cursor` and deletions after it, oldest first:
+    {'changes': [...], 'cursor': ..., 'more': ...}. Pass the returned cursor to get the next changes; without
+    a cursor the feed starts with every row.
+
+    The feed is not filtered by user. What an employee sees depends on the hierarchy and on project membership,
+    which change without saving the rows, so a filtered feed could not tell a mirror that rows left its view.
+    Mirrors get everything and authenticate with CHANGE_FEED_TOKEN instead.
+
+    Each kind is read with one query on its (last_modified, id) index. The feed stops CHANGE_FEED_DELAY seconds
+    before now: last_modified is set before a transaction commits, so rows of transactions still running may
+    appear with an older timestamp, and the cursor must not pass them yet.
+    """
+    position = decode_position(cursor) if cursor else None
+    until = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_DELAY)
+
+    entries = []
+    for kind, (name, resource) in enumerate(FEED):
+        queryset = after(resource.get_queryset(None), 'last_modified', kind, position)
+        queryset = queryset.filter(last_modified__lte=until).order_by('last_modified', 'pk')[:limit + 1]
+        fields = list(resource.columns()) + list(resource.links)
+        for result, (pk, modified) in resource.fetch(queryset, fields, 'last_modified'):
+            entries.append(((modified, kind, pk), {'type': name, 'id': pk, 'deleted': False, 'data': result}))
+
+    tombstones = after(Tombstone.objects.all(), 'deleted_at', DELETED, position)
+    tombstones = tombstones.filter(deleted_at__lte=until).order_by('deleted_at', 'pk')[:limit + 1]
+    for pk, name, object_id, deleted_at in tombstones.values_list('pk', 'model', 'object_id', 'deleted_at'):
+        entries.append(((deleted_at, DELETED, pk), {'type': name, 'id': object_id, 'deleted': True}))
+
+    entries.sort(key=lambda entry: entry[0])
+    more = len(entries) > limit
+    entries = entries[:limit]
+    if entries:
+        cursor = encode_position(entries[-1][0])
+    return {'changes': [change for position, change in entries], 'cursor': cursor, 'more': more}
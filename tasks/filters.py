@@ -2,30 +2,40 @@ from adminfilters.multiselect import UnionFieldListFilter
 from django.contrib.admin import SimpleListFilter
 from django_admin_listfilter_dropdown.filters import RelatedDropdownFilter, ChoiceDropdownFilter
 
-from tasks.lib import get_employee_subordinates, get_employee_tasks
-from tasks.models import Employee, Sprint, ROLES, Task
+from tasks.lib import get_employee_projects, get_subordinate_rows
+from tasks.models import Employee, Sprint, ROLES, Task, PROJECT_SPRINT_STATUSES
+
+
+def request_choices(request, name, load):
+    # Each changelist filter builds its choices with a single query, at most once per request.
+    choices = request.__dict__.setdefault('_filter_choices', {})
+    if name not in choices:
+        choices[name] = load()
+    return choices[name]
 
 
 class EmployeeFilter(RelatedDropdownFilter):
 
     def field_choices(self, field, request, model_admin):
-        employees = [(e.id, str(e)) for e in get_employee_subordinates(request.user, include_self=True)]
-        return employees
+        # get_subordinate_rows is shared with the permission checks and cached across requests
+        return [(pk, name) for pk, name, role in get_subordinate_rows(request.user)]
 
 
 class ProjectFilter(RelatedDropdownFilter):
     def field_choices(self, field, request, model_admin):
-        projects = request.user.employee_projects.all().union(request.user.created_projects.all())
-        return [(p.id, str(p)) for p in projects]
+        return request_choices(request, 'projects', lambda: [
+            (p.id, str(p)) for p in get_employee_projects(request.user).order_by('title', 'id')])
 
 
 class SprintFilter(RelatedDropdownFilter):
     def field_choices(self, field, request, model_admin):
-        projects = request.user.employee_projects.all().union(request.user.created_projects.all())
-        sprints = []
-        for project in projects:
-            sprints.extend(project.project_sprints.all())
-        return [(s.id, str(s)) for s in sprints]
+        return self.choices_for(request)
+
+    @staticmethod
+    def choices_for(request):
+        return request_choices(request, 'sprints', lambda: [
+            (s.id, str(s)) for s in Sprint.objects.filter(project__in=get_employee_projects(request.user))
+            .select_related('project').order_by('project__title', 'project_id', 'date_start', 'id')])
 
 
 class RoleFilter(SimpleListFilter):
@@ -34,11 +44,31 @@ class RoleFilter(SimpleListFilter):
     dict_ = dict(ROLES)
 
     def lookups(self, request, model_admin):
-        employees = get_employee_subordinates(request.user, include_self=True)
-        roles = set([(e.role, self.dict_[e.role]) for e in employees])
-        return list(roles)
+        # Derived from the subordinate rows EmployeeFilter already loaded, so it costs no query of its own.
+        return request_choices(request, 'roles', lambda: sorted(
+            {(role, self.dict_[role]) for pk, name, role in get_subordinate_rows(request.user)}))
 
     def queryset(self, request, queryset):
+        # The changelist queryset is already Task.objects.visible_to(request.user).
         if not self.value():
-            return Task.objects.filter(id__in=[task.id for task in get_employee_tasks(request.user)])
-        return Task.objects.filter(employee__role=self.value())
+            return queryset
+        return queryset.filter(employee__role=self.value())
+
+
+class EffectiveStatusFilter(SimpleListFilter):
+    title = 'Status'
+    parameter_name = 'effective_status'
+
+    def lookups(self, request, model_admin):
+        return PROJECT_SPRINT_STATUSES
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+
+
+class EffectiveStateFilter(EffectiveStatusFilter):
+    parameter_name = 'effective_state'
+
+    def lookups(self, request, model_admin):
+        return Task.STATUSES
@@ -1,8 +1,15 @@
 from django import forms
+from django.contrib.admin.helpers import ActionForm
 
+from tasks.graph import TaskCycleError, check_sub_tasks
 from tasks.models import Project, Sprint, Task
 
 
+def validate_dates(redline, deadline):
+    if redline and deadline and redline > deadline:
+        raise forms.ValidationError("Deadline must be greater (or equal) than Redline (`To be completed`)")
+
+
 class ProjectForm(forms.ModelForm):
     class Meta:
         model = Project
@@ -13,8 +20,7 @@ class ProjectForm(forms.ModelForm):
         deadline = self.cleaned_data.get('date_end', '')
         redline = self.cleaned_data.get('redline', '')
 
-        if redline and deadline and redline > deadline:
-            raise forms.ValidationError("Deadline must be greater (or equal) than Redline (`To be completed`)")
+        validate_dates(redline, deadline)
         return self.cleaned_data
 
 
@@ -28,8 +34,7 @@ class SprintForm(forms.ModelForm):
         deadline = self.cleaned_data.get('date_end', '')
         redline = self.cleaned_data.get('redline', '')
 
-        if redline and deadline and redline > deadline:
-            raise forms.ValidationError("Deadline must be greater (or equal) than Redline (`To be completed`)")
+        validate_dates(redline, deadline)
         return self.cleaned_data
 
 
@@ -43,6 +48,24 @@ class TaskForm(forms.ModelForm):
         deadline = self.cleaned_data.get('deadline', '')
         redline = self.cleaned_data.get('redline', '')
 
-        if redline and deadline and redline > deadline:
-            raise forms.ValidationError("Deadline must be greater (or equal) than Redline (`To be completed`)")
+        validate_dates(redline, deadline)
+        sub_tasks = self.cleaned_data.get('sub_tasks')
+        if sub_tasks is not None:
+            try:
+                check_sub_tasks(self.instance, [task.pk for task in sub_tasks])
+            except TaskCycleError as e:
+                self.add_error('sub_tasks', str(e))
         return self.cleaned_data
+
+
+class TaskImportForm(forms.Form):
+    file = forms.FileField(help_text="JSON lines or CSV (.csv) as written by the export action or export_tasks")
+
+
+class TaskActionForm(ActionForm):
+    # Arguments of the bulk actions of TaskAdmin. Employee and sprint choices depend on the user and are filled in
+    # by TaskAdmin.changelist_view; the actions check the submitted ids themselves.
+    state = forms.ChoiceField(label="Status", choices=(('', '---------'),) + Task.STATUSES, required=False)
+    priority = forms.ChoiceField(label="Priority", choices=(('', '---------'),) + Task.PRIORITIES, required=False)
+    employee = forms.IntegerField(label="Assigned", required=False, widget=forms.Select)
+    sprint = forms.IntegerField(label="Sprint", required=False, widget=forms.Select)
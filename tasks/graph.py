@@ -0,0 +1,181 @@
+from collections import defaultdict, deque
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+
+from tasks.models import Task
+
+SubTask = Task.sub_tasks.through
+
+
+class TaskCycleError(ValueError):
+    pass
+
+
+class TaskGraph:
+    """
+    The sub_tasks links between tasks as adjacency sets: `children[pk]` are the sub tasks of a task, `parents[pk]`
+    the tasks it is a sub task of. A project's graph is loaded with one query on the link table; all lookups
+    afterwards run in memory and stop at cycles already in the data.
+    """
+
+    def __init__(self, edges=(), using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self.children = defaultdict(set)
+        self.parents = defaultdict(set)
+        # task -> project, for the tasks seen in the loaded links
+        self.task_projects = {}
+        self.projects = set()
+        self.dates = None
+        for parent, child in edges:
+            self.add_edge(parent, child)
+
+    @classmethod
+    def for_project(cls, project_id, using=DEFAULT_DB_ALIAS):
+        return cls(using=using).load([project_id])
+
+    def load(self, project_ids, follow=False):
+        # Links from or to tasks of the projects. With `follow` the projects of linked tasks are loaded as well,
+        # one query per round, until the graph is closed over every reachable task.
+        project_ids = set(project_ids) - self.projects - {None}
+        while project_ids:
+            self.projects |= project_ids
+            links = SubTask.objects.using(self.using).filter(
+                Q(from_task__project_id__in=project_ids) | Q(to_task__project_id__in=project_ids)
+            ).values_list('from_task_id', 'to_task_id', 'from_task__project_id', 'to_task__project_id')
+            for parent, child, parent_project, child_project in links:
+                self.add_edge(parent, child)
+                self.task_projects[parent], self.task_projects[child] = parent_project, child_project
+            if not follow:
+                break
+            project_ids = set(self.task_projects.values()) - self.projects - {None}
+        return self
+
+    def add_edge(self, parent, child):
+        self.children[parent].add(child)
+        self.parents[child].add(parent)
+
+    def nodes(self):
+        return set(self.children) | set(self.parents) | set(self.dates or ())
+
+    def walk(self, start, neighbours):
+        seen, stack = set(), list(neighbours.get(start, ()))
+        while stack:
+            pk = stack.pop()
+            if pk not in seen:
+                seen.add(pk)
+                stack.extend(neighbours.get(pk, ()))
+        return seen
+
+    def descendants(self, pk):
+        # every sub task, transitively
+        return self.walk(pk, self.children)
+
+    def ancestors(self, pk):
+        return self.walk(pk, self.parents)
+
+    def path(self, start, end):
+        # shortest chain of sub task links from `start` to `end`, or None
+        previous, queue = {start: None}, deque([start])
+        while queue:
+            pk = queue.popleft()
+            if pk == end:
+                path = []
+                while pk is not None:
+                    path.append(pk)
+                    pk = previous[pk]
+                return path[::-1]
+            for child in sorted(self.children.get(pk, ())):
+                if child not in previous:
+                    previous[child] = pk
+                    queue.append(child)
+        return None
+
+    def check_edge(self, parent, child):
+        path = self.path(child, parent)
+        if path:
+            raise TaskCycleError(f"Task {child} cannot be a sub task of task {parent}, it would close the cycle "
+                                 f"{' -> '.join(map(str, [parent] + path))}")
+
+    def topological_order(self):
+        # Parents before their sub tasks, ties by id.
+        nodes = self.nodes()
+        waiting = {pk: len(self.parents.get(pk, ())) for pk in nodes}
+        ready = sorted(pk for pk, count in waiting.items() if not count)
+        order = []
+        while ready:
+            pk = ready.pop(0)
+            order.append(pk)
+            for child in sorted(self.children.get(pk, ())):
+                waiting[child] -= 1
+                if not waiting[child]:
+                    ready.append(child)
+        if len(order) < len(nodes):
+            raise TaskCycleError(f"Sub tasks form a cycle between tasks {sorted(nodes - set(order))}")
+        return order
+
+    def load_dates(self):
+        # (redline, deadline) of the tasks of the loaded projects and of linked tasks of other projects
+        foreign = [pk for pk, project_id in self.task_projects.items() if project_id not in self.projects]
+        self.dates = {pk: (redline, deadline) for pk, redline, deadline in Task.objects.using(self.using).filter(
+            Q(project_id__in=self.projects) | Q(pk__in=foreign)).values_list('pk', 'redline', 'deadline')}
+        return self.dates
+
+    def task_dates(self, pk):
+        return self.dates.get(pk, (None, None))
+
+    def dated_order(self):
+        # tasks without links are part of the graph too once the dates are loaded
+        if self.dates is None:
+            self.load_dates()
+        return self.topological_order()
+
+    def effective_deadlines(self):
+        # A sub task has to be done by the deadline of every task it is part of.
+        deadlines = {}
+        for pk in self.dated_order():
+            redline, deadline = self.task_dates(pk)
+            candidates = [deadline] + [deadlines[parent] for parent in self.parents.get(pk, ())]
+            deadlines[pk] = min((d for d in candidates if d), default=None)
+        return deadlines
+
+    def expected_completions(self):
+        # A task cannot be completed before its own redline and before all of its sub tasks are completed.
+        completions = {}
+        for pk in reversed(self.dated_order()):
+            redline, deadline = self.task_dates(pk)
+            candidates = [redline] + [completions[child] for child in self.children.get(pk, ())]
+            completions[pk] = max((d for d in candidates if d), default=None)
+        return completions
+
+    def critical_path(self, pk, completions=None):
+        # The chain of sub tasks that determines when `pk` can be completed, ending at the task whose own redline
+        # is the bottleneck.
+        completions = completions or self.expected_completions()
+        path = [pk]
+        while completions.get(pk):
+            late = [child for child in sorted(self.children.get(pk, ())) if completions[child] == completions[pk]]
+            if not late:
+                break
+            pk = late[0]
+            path.append(pk)
+        return path
+
+
+def check_sub_tasks(task, pks, reverse=False, using=DEFAULT_DB_ALIAS):
+    """
+    Raises TaskCycleError if the tasks `pks` cannot become sub tasks of `task` (or, with `reverse`, tasks that
+    `task` is a sub task of) without creating a cycle.
+    """
+    pks = set(pks)
+    if not task.pk or not pks:
+        return
+    if task.pk in pks:
+        raise TaskCycleError(f"Task {task.pk} cannot be a sub task of itself")
+    projects = set(Task.objects.using(using).filter(pk__in=pks).values_list('project_id', flat=True))
+    graph = TaskGraph(using=using).load(projects | {task.project_id}, follow=True)
+    for pk in sorted(pks):
+        if reverse:
+            graph.check_edge(pk, task.pk)
+        else:
+            graph.check_edge(task.pk, pk)
@@ -1,6 +1,17 @@
-from datetime import datetime
+from collections import defaultdict
 
-from tasks.models import Employee, Task, Project, Sprint
+from django.conf import settings
+from django.db.models import Q, Value
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
+
+from tasks.cache import get_cached_subordinate_rows, invalidate_subordinates
+from tasks.models import Employee, Task, Project, Sprint, OPEN_STATUSES, OPEN_TASK_STATES
+from tasks.rollups import recompute_task_rollups
+
+
+def computed_status_mode():
+    return settings.OVERDUE_STATUS_MODE == 'computed'
 
 
 class PmPermissionMixin:
@@ -11,58 +22,139 @@ class PmPermissionMixin:
 
 
 def get_employee_subordinates(employee, include_self=False):
-    r = []
-    if include_self:
-        r.append(employee)
-    for e in Employee.objects.filter(chief=employee):
-        _r = get_employee_subordinates(e, include_self=True)
-        if 0 < len(_r):
-            r.extend(_r)
-    return r
+    return Employee.objects.subordinates_of(employee, include_self=include_self)
+
+
+def get_subordinate_rows(employee):
+    # (id, name, role) of the employee and the whole subtree. Memoized on the instance: request.user lives
+    # for exactly one request, so permission checks, filters and forms share a single query per request.
+    # Across requests the rows are kept in the shared cache until the org chart changes around the employee.
+    rows = getattr(employee, '_subordinate_rows', None)
+    if rows is None:
+        rows = employee._subordinate_rows = get_cached_subordinate_rows(employee.pk, lambda: list(
+            get_employee_subordinates(employee, include_self=True).values_list('pk', 'name', 'role')))
+    return rows
+
+
+def get_subordinate_ids(employee, include_self=False):
+    ids = {pk for pk, name, role in get_subordinate_rows(employee)}
+    if not include_self:
+        ids.discard(employee.pk)
+    return ids
+
+
+def build_hierarchy_paths(chiefs):
+    # chiefs: {employee_id: chief_id}. Employees caught in a chief cycle are not reachable from the top
+    # of the org chart and become roots of their own.
+    children = defaultdict(list)
+    for pk, chief_id in chiefs.items():
+        children[chief_id].append(pk)
+    paths = {}
+    stack = [(pk, '/') for pk in children[None]]
+    while stack:
+        pk, prefix = stack.pop()
+        paths[pk] = f"{prefix}{pk}/"
+        stack.extend((child, paths[pk]) for child in children[pk] if child not in paths)
+    for pk in chiefs:
+        paths.setdefault(pk, f"/{pk}/")
+    return paths
+
+
+def rebuild_hierarchy_paths():
+    current = dict(Employee.objects.values_list('pk', 'hierarchy_path'))
+    paths = build_hierarchy_paths(dict(Employee.objects.values_list('pk', 'chief_id')))
+    changed = [Employee(pk=pk, hierarchy_path=path) for pk, path in paths.items() if current.get(pk) != path]
+    Employee.objects.bulk_update(changed, ['hierarchy_path'], batch_size=500)
+    invalidate_subordinates(*[current.get(e.pk) for e in changed], *[e.hierarchy_path for e in changed])
+    return len(changed)
+
+
+def move_employee_subtree(old_path, new_path):
+    Employee.objects.filter(hierarchy_path__startswith=old_path).update(
+        hierarchy_path=Concat(Value(new_path), Substr('hierarchy_path', len(old_path) + 1)))
+
+
+def sync_employee_hierarchy(employee):
+    paths = dict(Employee.objects.filter(pk__in=(employee.pk, employee.chief_id)).values_list('pk', 'hierarchy_path'))
+    prefix = paths.get(employee.chief_id) or '/'
+    if f"/{employee.pk}/" in prefix:
+        raise ValueError(f"{employee} cannot report to one of their own subordinates")
+    old_path, new_path = paths[employee.pk], f"{prefix}{employee.pk}/"
+    if old_path == new_path:
+        return old_path
+    if old_path:
+        move_employee_subtree(old_path, new_path)
+    else:
+        Employee.objects.filter(pk=employee.pk).update(hierarchy_path=new_path)
+    employee.hierarchy_path = new_path
+    return old_path
+
+
+def get_employee_projects(employee):
+    # Projects the employee works on or has created; unlike a union() the result can still be filtered and joined.
+    return Project.objects.filter(Q(created_by=employee) | Q(pk__in=employee.employee_projects.values('pk')))
 
 
 def get_employee_tasks(employee, include_self=True):
-    r = []
-    if include_self:
-        r.extend(employee.tasks_assigned.all())
-    for e in Employee.objects.filter(chief=employee):
-        _r = get_employee_tasks(e)
-        if 0 < len(_r):
-            r.extend(_r)
-    return r
-
-
-def delay_tasks():
-    Task.objects.filter(
-        state__in=('to-do', 'in_progress', 'postponed'),
-        redline__lte=datetime.now()
-    ).update(state='delay')
-
-    Task.objects.filter(
-        state__in=('to-do', 'in_progress', 'postponed', 'delay'),
-        deadline__lte=datetime.now()
-    ).update(state='late')
-
-
-def delay_projects():
-    Project.objects.filter(
-        status__in=('open', 'in_progress'),
-        redline__lt=datetime.now()
-    ).update(status='delay')
-
-    Project.objects.filter(
-        status__in=('open', 'in_progress', 'delay'),
-        date_end__lt=datetime.now()
-    ).update(status='late')
-
-
-def delay_sprints():
-    Sprint.objects.filter(
-        status__in=('open', 'in_progress'),
-        redline__lt=datetime.now()
-    ).update(status='delay')
-
-    Sprint.objects.filter(
-        status__in=('open', 'in_progress', 'delay'),
-        date_end__lt=datetime.now()
-    ).update(status='late')
+    # The same queryset instance is handed out for the whole request, so evaluating it twice hits its result cache.
+    visible_tasks = getattr(employee, '_visible_tasks', None)
+    if visible_tasks is None:
+        visible_tasks = employee._visible_tasks = {}
+    if include_self not in visible_tasks:
+        visible_tasks[include_self] = Task.objects.visible_to(employee, include_self=include_self)
+    return visible_tasks[include_self]
+
+
+def update_in_batches(queryset, batch_size, on_batch=None, **values):
+    # Small primary-key batches keep each UPDATE short so sweeps don't hold row locks for the whole table.
+    # `on_batch` is called with the updated rows after each batch.
+    updated = 0
+    while True:
+        batch = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return updated
+        updated += queryset.filter(pk__in=batch).update(**values)
+        if on_batch:
+            on_batch(queryset.model.objects.filter(pk__in=batch))
+
+
+def delay_tasks(batch_size=500):
+    now = timezone.now()
+    updated = update_in_batches(Task.objects.filter(
+        state__in=OPEN_TASK_STATES,
+        redline__lte=now
+    ), batch_size, recompute_task_rollups, state='delay', last_modified=now)
+
+    updated += update_in_batches(Task.objects.filter(
+        state__in=OPEN_TASK_STATES + ('delay',),
+        deadline__lte=now
+    ), batch_size, recompute_task_rollups, state='late', last_modified=now)
+    return updated
+
+
+def delay_projects(batch_size=500):
+    now = timezone.now()
+    updated = update_in_batches(Project.objects.filter(
+        status__in=OPEN_STATUSES,
+        redline__lt=timezone.localdate(now)
+    ), batch_size, status='delay', last_modified=now)
+
+    updated += update_in_batches(Project.objects.filter(
+        status__in=OPEN_STATUSES + ('delay',),
+        date_end__lt=timezone.localdate(now)
+    ), batch_size, status='late', last_modified=now)
+    return updated
+
+
+def delay_sprints(batch_size=500):
+    now = timezone.now()
+    updated = update_in_batches(Sprint.objects.filter(
+        status__in=OPEN_STATUSES,
+        redline__lt=timezone.localdate(now)
+    ), batch_size, status='delay', last_modified=now)
+
+    updated += update_in_batches(Sprint.objects.filter(
+        status__in=OPEN_STATUSES + ('delay',),
+        date_end__lt=timezone.localdate(now)
+    ), batch_size, status='late', last_modified=now)
+    return updated
@@ -0,0 +1,122 @@
+import json
+import statistics
+from time import perf_counter
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+
+from pm.metrics import QueryRecorder
+from tasks.lib import get_employee_subordinates
+from tasks.models import Employee, Project, Sprint, Task
+from tasks.sweeper import sweep_overdue
+
+ROLES = ('pm', 'lead_dev', 'area_dev', 'dev')
+
+
+class Command(BaseCommand):
+    help = "Times the key request paths against the current database (see generate_data) " \
+           "and optionally saves the results as JSON for comparison between runs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--compare', help="JSON file of a previous run to compare with")
+
+    def handle(self, *args, **options):
+        users = {role: Employee.objects.filter(role=role).order_by('hierarchy_path').first() for role in ROLES}
+        if not all(users.values()):
+            raise CommandError("No employees for every benchmark role, run generate_data first")
+        self.repeat = options['repeat']
+        self.clients = {}
+        root = users['pm']
+        task = Task.objects.visible_to(root).order_by('id').first()
+        project = Project.objects.filter(created_by=root).order_by('id').first()
+        sprint = Sprint.objects.filter(project=project).order_by('id').first()
+
+        results = {}
+        for role, user in users.items():
+            results[f'task changelist ({role})'] = self.measure_get(user, '/tasks/task/')
+        results['sprint changelist (pm)'] = self.measure_get(root, '/tasks/sprint/')
+        results['project changelist (pm)'] = self.measure_get(root, '/tasks/project/')
+        if task:
+            results['task change form (pm)'] = self.measure_get(root, f'/tasks/task/{task.pk}/change/')
+        if project:
+            results['api options (cold)'] = self.measure_get(root, f'/api/options?id={project.pk}', cache.clear)
+            results['api options (warm)'] = self.measure_get(root, f'/api/options?id={project.pk}')
+            results['filter by project'] = self.measure_get(root, f'/tasks/task/?project__id__exact={project.pk}')
+        if sprint:
+            results['filter by sprint'] = self.measure_get(root, f'/tasks/task/?sprint__id__exact={sprint.pk}')
+        results['filter by role'] = self.measure_get(root, '/tasks/task/?employee__role=dev')
+        results['filter by employee'] = self.measure_get(root, f"/tasks/task/?employee__id__exact={users['dev'].pk}")
+        results['subordinates (pm)'] = self.measure(lambda: list(get_employee_subordinates(root)))
+        results['overdue sweep'] = self.measure(self.rolled_back_sweep)
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'dataset': {model.__name__: model.objects.count() for model in (Employee, Project, Sprint, Task)},
+            'repeat': self.repeat,
+            'results': results,
+        }
+        previous = self.load(options['compare'])['results'] if options['compare'] else {}
+        self.print_report(report, previous)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def load(self, path):
+        with open(path) as f:
+            return json.load(f)
+
+    def client_for(self, user):
+        if user.pk not in self.clients:
+            self.clients[user.pk] = Client()
+            self.clients[user.pk].force_login(user)
+        return self.clients[user.pk]
+
+    def measure_get(self, user, url, setup=None):
+        client = self.client_for(user)
+
+        def get():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f"GET {url} returned {response.status_code}")
+
+        return self.measure(get, setup)
+
+    def rolled_back_sweep(self):
+        with transaction.atomic():
+            sweep_overdue()
+            transaction.set_rollback(True)
+
+    def measure(self, func, setup=None):
+        timings, queries = [], 0
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                started = perf_counter()
+                func()
+                timings.append((perf_counter() - started) * 1000)
+            queries = recorder.count
+        timings.sort()
+        return {
+            'min_ms': round(timings[0], 2),
+            'median_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+            'queries': queries,
+        }
+
+    def print_report(self, report, previous):
+        self.stdout.write(f"{report['database']}: " + ', '.join(f"{count} {name.lower()}s"
+                                                                for name, count in report['dataset'].items()))
+        for name, result in report['results'].items():
+            line = f"{name:<28} median {result['median_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  " \
+                   f"{result['queries']:>5} queries"
+            if name in previous:
+                line += f"  ({result['median_ms'] / max(previous[name]['median_ms'], 0.01):.2f}x previous)"
+            self.stdout.write(line)
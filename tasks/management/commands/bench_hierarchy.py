@@ -0,0 +1,69 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from tasks.lib import build_hierarchy_paths, get_employee_subordinates
+from tasks.models import Employee, SubtreeIds
+
+
+def get_employee_subordinates_recursive(employee, include_self=False):
+    # The original depth-first walk: one query per node of the subtree.
+    r = []
+    if include_self:
+        r.append(employee)
+    for e in Employee.objects.filter(chief=employee):
+        r.extend(get_employee_subordinates_recursive(e, include_self=True))
+    return r
+
+
+class Command(BaseCommand):
+    help = "Compares the hierarchy index and the recursive CTE with the recursive subordinates walk on a " \
+           "synthetic org chart. " \
+           "The synthetic employees are rolled back afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=5000)
+        parser.add_argument('--fanout', type=int, default=8)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            root = self.create_org(options['size'], options['fanout'])
+            heads = list(Employee.objects.filter(chief=root)[:2])
+            samples = [('root', root)] + [(f"department head #{i + 1}", e) for i, e in enumerate(heads)]
+            for label, employee in samples:
+                self.stdout.write(f"{label}:")
+                self.measure('recursive', get_employee_subordinates_recursive, employee, options['repeat'])
+                self.measure('indexed', lambda e: list(get_employee_subordinates(e)), employee, options['repeat'])
+                self.measure('cte', lambda e: list(Employee.objects.filter(pk__in=SubtreeIds(e.pk, False))),
+                             employee, options['repeat'])
+            transaction.set_rollback(True)
+
+    def create_org(self, size, fanout):
+        start = (Employee.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+        chiefs = {start + i: (start + (i - 1) // fanout if i else None) for i in range(size)}
+        paths = build_hierarchy_paths(chiefs)
+        Employee.objects.bulk_create([
+            Employee(id=pk, username=f"bench-{pk}", password='!', name=f"Employee {pk}", role='dev',
+                     chief_id=chief_id, hierarchy_path=paths[pk])
+            for pk, chief_id in chiefs.items()
+        ], batch_size=500)
+        return Employee.objects.get(pk=start)
+
+    def measure(self, label, func, employee, repeat):
+        timings, count, queries = [], 0, []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        for _ in range(repeat):
+            queries.clear()
+            with connection.execute_wrapper(count_queries):
+                started = perf_counter()
+                count = len(func(employee))
+                timings.append(perf_counter() - started)
+        self.stdout.write(f"  {label:<10} {count:>6} subordinates  {len(queries):>6} queries  "
+                          f"best {min(timings) * 1000:9.2f} ms")
@@ -0,0 +1,39 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+
+from tasks.api import API_MAX_PAGE_SIZE, ApiError
+from tasks.changes import read_changes
+
+
+class Command(BaseCommand):
+    help = "Writes the tasks, sprints and projects changed or deleted since --since as JSON lines, and the cursor " \
+           "to continue from to stderr. With --follow it keeps polling every --interval seconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Cursor printed by an earlier run, the first run starts with every row")
+        parser.add_argument('--batch-size', type=int, default=API_MAX_PAGE_SIZE)
+        parser.add_argument('--follow', action='store_true')
+        parser.add_argument('--interval', type=float, default=5)
+
+    def handle(self, *args, **options):
+        cursor = options['since']
+        while True:
+            try:
+                feed = read_changes(cursor, options['batch_size'])
+            except ApiError as e:
+                raise CommandError(str(e))
+            for change in feed['changes']:
+                self.stdout.write(json.dumps(change, cls=DjangoJSONEncoder))
+            if feed['cursor'] != cursor:
+                cursor = feed['cursor']
+                self.stderr.write(f"Cursor: {cursor}")
+            if feed['more']:
+                continue
+            if not options['follow']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from tasks.models import Task
+from tasks.transfer import FORMATS, export_lines, export_records
+
+
+class Command(BaseCommand):
+    help = "Streams tasks with their checklist items and sub_task links as JSON lines or CSV, " \
+           "in the format import_tasks reads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help="File to write, `-` for standard output")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the extension of --output, else jsonl")
+        parser.add_argument('--project', type=int, action='append', help="Only tasks of this project (repeatable)")
+
+    def handle(self, *args, **options):
+        output = options['output']
+        format = options['format'] or ('csv' if output.endswith('.csv') else 'jsonl')
+        tasks = Task.objects.all()
+        if options['project']:
+            tasks = tasks.filter(project_id__in=options['project'])
+
+        lines = export_lines(export_records(tasks), format)
+        if output == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+        else:
+            with open(output, 'w', newline='', encoding='utf-8') as f:
+                f.writelines(lines)
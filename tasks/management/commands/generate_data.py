@@ -0,0 +1,161 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from tasks.cache import HIERARCHY, bump_versions
+from tasks.lib import build_hierarchy_paths
+from tasks.rollups import recompute_rollups
+from tasks.models import Employee, Project, Sprint, Task, Item, PROJECT_SPRINT_STATUSES
+
+BRANCHES = (
+    ('lead_dev', 'area_dev', 'dev'),
+    ('lead_qa', 'area_qa', 'qa'),
+    ('lead_analyst', 'area_analyst', 'analyst'),
+)
+
+
+class Command(BaseCommand):
+    help = "Generates a synthetic organization: an employee hierarchy of --depth levels with --fanout " \
+           "subordinates per chief, projects, sprints, tasks with sub_tasks and checklist items. " \
+           "Every synthetic employee can log in with the password `synthetic`."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depth', type=int, default=4)
+        parser.add_argument('--fanout', type=int, default=5)
+        parser.add_argument('--projects', type=int, default=10)
+        parser.add_argument('--sprints', type=int, default=6, help="Sprints per project")
+        parser.add_argument('--tasks', type=int, default=500, help="Tasks per project")
+        parser.add_argument('--subtasks', type=int, default=3, help="Maximum sub_tasks per task")
+        parser.add_argument('--items', type=int, default=4, help="Maximum checklist items per task")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, help="Rows per INSERT, defaults to the backend limit")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        with transaction.atomic():
+            employees = self.create_employees(options['depth'], options['fanout'])
+            projects = self.create_projects(options['projects'], employees)
+            sprints = self.create_sprints(projects, options['sprints'])
+            tasks = self.create_tasks(projects, sprints, options['tasks'])
+            self.create_sub_tasks(tasks, options['subtasks'])
+            items = self.create_items(tasks, options['items'])
+            recompute_rollups()
+            self.reset_sequences()
+        bump_versions(HIERARCHY)
+        self.stdout.write(f"Created {len(employees)} employees, {len(projects)} projects, {len(sprints)} sprints, "
+                          f"{len(tasks)} tasks, {items} items")
+
+    def next_ids(self, model, count):
+        start = (model.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+        return range(start, start + count)
+
+    def reset_sequences(self):
+        # Rows were inserted with explicit ids so that children can reference them on every backend.
+        statements = connection.ops.sequence_reset_sql(no_style(), [Employee, Project, Sprint, Task, Item])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def create_employees(self, depth, fanout):
+        size = sum(fanout ** level for level in range(depth + 1))
+        ids = iter(self.next_ids(Employee, size))
+        root = next(ids)
+        nodes = {root: (None, 'pm')}
+        level = [(root, None)]
+        for depth_level in range(1, depth + 1):
+            next_level = []
+            for chief_id, branch in level:
+                for i in range(fanout):
+                    pk = next(ids)
+                    node_branch = branch if branch is not None else BRANCHES[i % len(BRANCHES)]
+                    nodes[pk] = (chief_id, node_branch[min(depth_level, 3) - 1])
+                    next_level.append((pk, node_branch))
+            level = next_level
+
+        paths = build_hierarchy_paths({pk: chief_id for pk, (chief_id, _) in nodes.items()})
+        password = make_password('synthetic')
+        employees = [
+            Employee(id=pk, username=f"synthetic-{pk}", password=password, name=f"Synthetic {role} {pk}", role=role,
+                     chief_id=chief_id, hierarchy_path=paths[pk], is_staff=True, is_superuser=True)
+            for pk, (chief_id, role) in nodes.items()
+        ]
+        Employee.objects.bulk_create(employees, batch_size=self.batch_size)
+        return employees
+
+    def create_projects(self, count, employees):
+        root = employees[0]
+        projects = []
+        for pk in self.next_ids(Project, count):
+            start = self.now.date() - timedelta(days=self.random.randint(30, 180))
+            projects.append(Project(id=pk, title=f"Synthetic project {pk}", short_name=f"SP{pk}",
+                                    status=self.random.choice(PROJECT_SPRINT_STATUSES)[0], date_start=start,
+                                    redline=start + timedelta(days=150), date_end=start + timedelta(days=180),
+                                    created_by=root))
+        Project.objects.bulk_create(projects, batch_size=self.batch_size)
+        Membership = Project.employees.through
+        memberships = []
+        for project in projects:
+            project.members = [e for e in employees[1:] if self.random.random() < 0.5] or employees[1:2]
+            memberships.extend(Membership(project_id=project.id, employee_id=employee.id)
+                               for employee in [root] + project.members)
+        Membership.objects.bulk_create(memberships, batch_size=self.batch_size)
+        return projects
+
+    def create_sprints(self, projects, per_project):
+        ids = iter(self.next_ids(Sprint, len(projects) * per_project))
+        sprints = []
+        for project in projects:
+            for i in range(per_project):
+                start = self.now.date() + timedelta(days=14 * (i - per_project // 2))
+                sprints.append(Sprint(id=next(ids), project_id=project.id, title=f"Sprint {i + 1}",
+                                      status=self.random.choice(PROJECT_SPRINT_STATUSES)[0], date_start=start,
+                                      redline=start + timedelta(days=10), date_end=start + timedelta(days=14),
+                                      created_by_id=project.created_by_id))
+        Sprint.objects.bulk_create(sprints, batch_size=self.batch_size)
+        return sprints
+
+    def create_tasks(self, projects, sprints, per_project):
+        ids = iter(self.next_ids(Task, len(projects) * per_project))
+        sprints_by_project = {}
+        for sprint in sprints:
+            sprints_by_project.setdefault(sprint.project_id, []).append(sprint)
+        tasks = []
+        for project in projects:
+            for i in range(per_project):
+                redline = self.now + timedelta(hours=self.random.randint(-24 * 30, 24 * 60))
+                tasks.append(Task(id=next(ids), project_id=project.id, title=f"Synthetic task {i + 1}",
+                                  sprint=self.random.choice(sprints_by_project.get(project.id, [None])),
+                                  description="Generated task description", accept_criterion="Generated criterion",
+                                  employee=self.random.choice(project.members),
+                                  state=self.random.choice(Task.STATUSES)[0],
+                                  priority=self.random.choice(Task.PRIORITIES)[0],
+                                  redline=redline, deadline=redline + timedelta(days=self.random.randint(0, 14)),
+                                  created_by_id=project.created_by_id))
+        Task.objects.bulk_create(tasks, batch_size=self.batch_size)
+        return tasks
+
+    def create_sub_tasks(self, tasks, maximum):
+        # Sub tasks always point to a later task of the same project, so the generated graph has no cycles.
+        SubTask = Task.sub_tasks.through
+        links = []
+        for i, task in enumerate(tasks):
+            candidates = [t for t in tasks[i + 1:i + 50] if t.project_id == task.project_id]
+            for sub_task in self.random.sample(candidates, min(len(candidates), self.random.randint(0, maximum))):
+                links.append(SubTask(from_task_id=task.id, to_task_id=sub_task.id))
+        SubTask.objects.bulk_create(links, batch_size=self.batch_size)
+
+    def create_items(self, tasks, maximum):
+        items = [
+            Item(task_id=task.id, item_description=f"Checklist item {i + 1}", is_done=self.random.random() < 0.5)
+            for task in tasks for i in range(self.random.randint(0, maximum))
+        ]
+        Item.objects.bulk_create(items, batch_size=self.batch_size)
+        return len(items)
@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from tasks.transfer import FORMATS, TaskImporter, read_records
+
+
+class Command(BaseCommand):
+    help = "Imports tasks, checklist items and sub_task links written by export_tasks. Records are validated " \
+           "like the task form, inserted with bulk_create and committed in batches; invalid records are skipped " \
+           "and reported."
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="File to read, `-` for standard input")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the extension of the input, else jsonl")
+        parser.add_argument('--batch-size', type=int, default=500, help="Records per INSERT and transaction")
+
+    def handle(self, *args, **options):
+        path = options['input']
+        format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        importer = TaskImporter(batch_size=options['batch_size'])
+        if path == '-':
+            counts = importer.run(read_records(sys.stdin, format))
+        else:
+            with open(path, newline='', encoding='utf-8') as f:
+                counts = importer.run(read_records(f, format))
+
+        for line, message in importer.errors:
+            self.stderr.write(f"line {line}: {message}")
+        self.stdout.write(f"Imported {counts['task']} tasks, {counts['item']} items, {counts['sub_task']} sub_task "
+                          f"links, skipped {len(importer.errors)} records")
@@ -0,0 +1,73 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from time import perf_counter
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.models import Employee
+
+
+def percentile(timings, p):
+    # nearest rank
+    ordered = sorted(timings)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def login_session(username):
+    # A session for the user in the server's session store, as the test client's force_login creates it.
+    try:
+        user = Employee.objects.get(username=username)
+    except Employee.DoesNotExist:
+        raise CommandError(f"Unknown user {username!r}")
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return session.session_key
+
+
+class Command(BaseCommand):
+    help = "Sends --requests GET requests to a running server, --concurrency at a time, and reports requests " \
+           "per second and latency percentiles. Run it against `gunicorn pm.wsgi` and `uvicorn pm.asgi:application` " \
+           "to compare the deployments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('url')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--user', help="Send the requests logged in as this user")
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['user']:
+            headers['Cookie'] = f"{settings.SESSION_COOKIE_NAME}={login_session(options['user'])}"
+
+        def fetch(_):
+            started = perf_counter()
+            try:
+                with urlopen(Request(options['url'], headers=headers), timeout=options['timeout']) as response:
+                    response.read()
+                    status = response.status
+            except HTTPError as e:
+                status = e.code
+            except (URLError, OSError):
+                status = None
+            return perf_counter() - started, status
+
+        started = perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(fetch, range(options['requests'])))
+        wall = perf_counter() - started
+
+        timings = [duration for duration, status in results]
+        errors = sum(1 for duration, status in results if status != 200)
+        self.stdout.write(f"{len(results)} requests, {options['concurrency']} concurrent, {errors} errors")
+        self.stdout.write(f"{len(results) / wall:.1f} requests/s  p50 {percentile(timings, 50) * 1000:.1f} ms  "
+                          f"p99 {percentile(timings, 99) * 1000:.1f} ms")
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tasks.rollups import reconcile_rollups
+
+
+class Command(BaseCommand):
+    help = "Recounts the task and checklist item progress of every sprint and project and reports the drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep reconciling every --interval seconds")
+        parser.add_argument('--interval', type=int, default=60 * 60)
+
+    def handle(self, *args, **options):
+        while True:
+            drifted = reconcile_rollups()
+            self.stdout.write(f"Corrected {drifted['sprint']} sprints, {drifted['project']} projects")
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
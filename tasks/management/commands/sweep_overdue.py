@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tasks.sweeper import sweep_overdue
+
+
+class Command(BaseCommand):
+    help = "Moves overdue tasks, sprints and projects to the `delay`/`late` states."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OVERDUE_SWEEP_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping every --interval seconds")
+        parser.add_argument('--interval', type=int, default=settings.OVERDUE_SWEEP_INTERVAL or 60)
+
+    def handle(self, *args, **options):
+        while True:
+            updated = sweep_overdue(options['batch_size'])
+            self.stdout.write(f"Updated {updated} rows")
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
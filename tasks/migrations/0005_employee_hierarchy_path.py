@@ -0,0 +1,52 @@
+# Generated by Django 2.2.14 on 2021-01-10 12:00
+
+from django.db import migrations, models
+import tasks.models
+
+
+def fill_hierarchy_paths(apps, schema_editor):
+    Employee = apps.get_model('tasks', 'Employee')
+    chiefs = dict(Employee.objects.values_list('pk', 'chief_id'))
+    children = {}
+    for pk, chief_id in chiefs.items():
+        children.setdefault(chief_id, []).append(pk)
+    paths = {}
+    stack = [(pk, '/') for pk in children.get(None, [])]
+    while stack:
+        pk, prefix = stack.pop()
+        paths[pk] = f"{prefix}{pk}/"
+        stack.extend((child, paths[pk]) for child in children.get(pk, []) if child not in paths)
+    for pk in chiefs:
+        Employee.objects.filter(pk=pk).update(hierarchy_path=paths.get(pk, f"/{pk}/"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_auto_20201226_1528'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='employee',
+            managers=[
+                ('objects', tasks.models.EmployeeManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='hierarchy_path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Hierarchy path'),
+        ),
+        migrations.RunPython(fill_hierarchy_paths, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='project',
+            name='status',
+            field=models.CharField(choices=[('open', 'Not started'), ('in_progress', 'In progress'), ('closed', 'Completed'), ('delay', 'Delayed'), ('late', 'Being late')], max_length=20, verbose_name='Status'),
+        ),
+        migrations.AlterField(
+            model_name='sprint',
+            name='status',
+            field=models.CharField(choices=[('open', 'Not started'), ('in_progress', 'In progress'), ('closed', 'Completed'), ('delay', 'Delayed'), ('late', 'Being late')], max_length=20, verbose_name='Status'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.14 on 2021-01-12 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0005_employee_hierarchy_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sweep',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Name')),
+                ('started_at', models.DateTimeField(null=True, verbose_name='Started at')),
+                ('finished_at', models.DateTimeField(null=True, verbose_name='Finished at')),
+                ('updated', models.PositiveIntegerField(default=0, verbose_name='Updated rows')),
+            ],
+            options={
+                'verbose_name': 'Sweep',
+                'verbose_name_plural': 'Sweeps',
+            },
+        ),
+    ]
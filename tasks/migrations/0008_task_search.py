@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# The statements of tasks.search as of this migration.
+POSTGRES_CREATE = [
+    "CREATE INDEX IF NOT EXISTS task_search_idx ON tasks_task USING GIN (to_tsvector('simple', "
+    "coalesce(title, '') || ' ' || coalesce(description, '') || ' ' || coalesce(accept_criterion, '')))",
+]
+
+POSTGRES_DROP = ['DROP INDEX IF EXISTS task_search_idx']
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_task_fts USING fts5(title, description, accept_criterion, "
+    "content='tasks_task', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS tasks_task_fts_insert AFTER INSERT ON tasks_task BEGIN "
+    "INSERT INTO tasks_task_fts(rowid, title, description, accept_criterion) "
+    "VALUES (new.id, new.title, new.description, new.accept_criterion); END",
+    "CREATE TRIGGER IF NOT EXISTS tasks_task_fts_delete AFTER DELETE ON tasks_task BEGIN "
+    "INSERT INTO tasks_task_fts(tasks_task_fts, rowid, title, description, accept_criterion) "
+    "VALUES ('delete', old.id, old.title, old.description, old.accept_criterion); END",
+    "CREATE TRIGGER IF NOT EXISTS tasks_task_fts_update AFTER UPDATE OF title, description, accept_criterion "
+    "ON tasks_task BEGIN "
+    "INSERT INTO tasks_task_fts(tasks_task_fts, rowid, title, description, accept_criterion) "
+    "VALUES ('delete', old.id, old.title, old.description, old.accept_criterion); "
+    "INSERT INTO tasks_task_fts(rowid, title, description, accept_criterion) "
+    "VALUES (new.id, new.title, new.description, new.accept_criterion); END",
+    "INSERT INTO tasks_task_fts(tasks_task_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS tasks_task_fts_insert',
+    'DROP TRIGGER IF EXISTS tasks_task_fts_delete',
+    'DROP TRIGGER IF EXISTS tasks_task_fts_update',
+    'DROP TABLE IF EXISTS tasks_task_fts',
+]
+
+
+def execute(schema_editor, statements):
+    statements = statements.get(schema_editor.connection.vendor, [])
+    with schema_editor.connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def create_index(apps, schema_editor):
+    execute(schema_editor, {'postgresql': POSTGRES_CREATE, 'sqlite': SQLITE_CREATE})
+
+
+def drop_index(apps, schema_editor):
+    execute(schema_editor, {'postgresql': POSTGRES_DROP, 'sqlite': SQLITE_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0007_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 2.2.14 on 2021-01-25 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count(queryset, aggregate):
+    return Coalesce(Subquery(queryset.annotate(count=aggregate).values('count')), 0)
+
+
+def fill_rollups(apps, schema_editor):
+    # The counts of tasks.rollups.recompute_rollups, on the historical models.
+    Task, Item = apps.get_model('tasks', 'Task'), apps.get_model('tasks', 'Item')
+    for name in ('sprint', 'project'):
+        tasks = Task.objects.filter(**{name: OuterRef('pk')}).order_by().values(name)
+        items = Item.objects.filter(**{f'task__{name}': OuterRef('pk')}).order_by().values(f'task__{name}')
+        apps.get_model('tasks', name).objects.using(schema_editor.connection.alias).update(
+            tasks_total=count(tasks, Count('pk')),
+            tasks_done=count(tasks, Count('pk', filter=Q(state='done'))),
+            tasks_delay=count(tasks, Count('pk', filter=Q(state='delay'))),
+            tasks_late=count(tasks, Count('pk', filter=Q(state='late'))),
+            items_total=count(items, Count('pk')),
+            items_done=count(items, Count('pk', filter=Q(is_done=True))),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0008_task_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='items_done',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Completed items'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='items_total',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Items'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='tasks_delay',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Delayed tasks'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='tasks_done',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Completed tasks'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='tasks_late',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Late tasks'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='tasks_total',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Tasks'),
+        ),
+        migrations.AddField(
+            model_name='sprint',
+            name='items_done',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Completed items'),
+        ),
+        migrations.AddField(
+            model_name='sprint',
+            name='items_total',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Items'),
+        ),
+        migrations.AddField(
+            model_name='sprint',
+            name='tasks_delay',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Delayed tasks'),
+        ),
+        migrations.AddField(
+            model_name='sprint',
+            name='tasks_done',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Completed tasks'),
+        ),
+        migrations.AddField(
+            model_name='sprint',
+            name='tasks_late',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Late tasks'),
+        ),
+        migrations.AddField(
+            model_name='sprint',
+            name='tasks_total',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Tasks'),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
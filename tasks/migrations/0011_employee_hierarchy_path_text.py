@@ -0,0 +1,18 @@
+# Generated by Django 2.2.14 on 2021-02-08 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0010_change_feed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='employee',
+            name='hierarchy_path',
+            field=models.TextField(db_index=True, default='', editable=False, verbose_name='Hierarchy path'),
+        ),
+    ]
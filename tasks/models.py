@@ -1,6 +1,10 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.expressions import RawSQL
 from django.conf import settings
+from django.utils import timezone
 
 PROJECT_SPRINT_STATUSES = (
     ('open', 'Not started'),
@@ -9,12 +13,80 @@ PROJECT_SPRINT_STATUSES = (
     ('delay', 'Delayed'),
     ('late', 'Being late'),
 )
+OPEN_STATUSES = ('open', 'in_progress')
+OPEN_TASK_STATES = ('to-do', 'in_progress', 'postponed')
 
 
-class Project(models.Model):
+class LoadedValuesMixin:
+    # Remembers `tracked_fields` as they were loaded from the database so that signal handlers
+    # can tell what a save has actually changed.
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_values()
+        return instance
+
+    def remember_loaded_values(self):
+        self._loaded_values = {f: self.__dict__.get(f) for f in self.tracked_fields}
+
+    def loaded_value(self, field):
+        return getattr(self, '_loaded_values', {}).get(field)
+
+    def changed_fields(self):
+        loaded = getattr(self, '_loaded_values', {})
+        return {f for f in self.tracked_fields if loaded.get(f) != self.__dict__.get(f)}
+
+
+class StatusQuerySet(models.QuerySet):
+    def with_effective_status(self, today=None):
+        today = today or timezone.localdate()
+        return self.annotate(effective_status=Case(
+            When(status__in=OPEN_STATUSES + ('delay',), date_end__lt=today, then=Value('late')),
+            When(status__in=OPEN_STATUSES, redline__lt=today, then=Value('delay')),
+            default=F('status'),
+            output_field=models.CharField(),
+        ))
+
+
+class StatusMixin:
+    def get_effective_status(self, today=None):
+        today = today or timezone.localdate()
+        if self.status in OPEN_STATUSES + ('delay',) and self.date_end and self.date_end < today:
+            return 'late'
+        if self.status in OPEN_STATUSES and self.redline and self.redline < today:
+            return 'delay'
+        return self.status
+
+
+class Rollup(models.Model):
+    # Progress counters over the tasks and checklist items, kept up to date by tasks.rollups.
+    class Meta:
+        abstract = True
+
+    tasks_total = models.PositiveIntegerField("Tasks", default=0, editable=False)
+    tasks_done = models.PositiveIntegerField("Completed tasks", default=0, editable=False)
+    tasks_delay = models.PositiveIntegerField("Delayed tasks", default=0, editable=False)
+    tasks_late = models.PositiveIntegerField("Late tasks", default=0, editable=False)
+    items_total = models.PositiveIntegerField("Items", default=0, editable=False)
+    items_done = models.PositiveIntegerField("Completed items", default=0, editable=False)
+
+
+class Project(StatusMixin, Rollup):
     class Meta:
         verbose_name = 'Project'
         verbose_name_plural = 'Projects'
+        indexes = [
+            models.Index(fields=['created_by', '-created_at'], name='project_created_idx'),
+            # overdue sweep, see tasks.lib.delay_projects
+            models.Index(fields=['status', 'redline'], name='project_status_redline_idx'),
+            models.Index(fields=['status', 'date_end'], name='project_status_date_end_idx'),
+            # change feed, see tasks.changes
+            models.Index(fields=['last_modified', 'id'], name='project_modified_idx'),
+        ]
+
+    objects = StatusQuerySet.as_manager()
 
     title = models.CharField("Title", max_length=100, null=False, blank=False)
     short_name = models.CharField("Short name", null=False, blank=False, max_length=20)
@@ -35,10 +107,21 @@ class Project(models.Model):
         return self.title
 
 
-class Sprint(models.Model):
+class Sprint(LoadedValuesMixin, StatusMixin, Rollup):
     class Meta:
         verbose_name = 'Sprint'
         verbose_name_plural = 'Sprints'
+        indexes = [
+            models.Index(fields=['created_by', '-created_at'], name='sprint_created_idx'),
+            # overdue sweep, see tasks.lib.delay_sprints
+            models.Index(fields=['status', 'redline'], name='sprint_status_redline_idx'),
+            models.Index(fields=['status', 'date_end'], name='sprint_status_date_end_idx'),
+            # change feed, see tasks.changes
+            models.Index(fields=['last_modified', 'id'], name='sprint_modified_idx'),
+        ]
+
+    objects = StatusQuerySet.as_manager()
+    tracked_fields = ('project_id',)
 
     project = models.ForeignKey(Project, related_name='project_sprints', null=False, blank=False,
                                 on_delete=models.CASCADE)
@@ -57,10 +140,37 @@ class Sprint(models.Model):
         return f"({self.project.short_name}) {self.title}"
 
 
-class Task(models.Model):
+class TaskQuerySet(models.QuerySet):
+    def visible_to(self, employee, include_self=True):
+        return self.filter(employee__in=Employee.objects.subordinates_of(employee, include_self=include_self))
+
+    def with_effective_state(self, now=None):
+        now = now or timezone.now()
+        return self.annotate(effective_state=Case(
+            When(state__in=OPEN_TASK_STATES + ('delay',), deadline__lte=now, then=Value('late')),
+            When(state__in=OPEN_TASK_STATES, redline__lte=now, then=Value('delay')),
+            default=F('state'),
+            output_field=models.CharField(),
+        ))
+
+
+class Task(LoadedValuesMixin, models.Model):
     class Meta:
         verbose_name = "Task"
         verbose_name_plural = "Tasks"
+        indexes = [
+            models.Index(fields=['-created_at'], name='task_created_idx'),
+            models.Index(fields=['employee', 'state'], name='task_employee_state_idx'),
+            models.Index(fields=['project', 'sprint'], name='task_project_sprint_idx'),
+            # overdue sweep, see tasks.lib.delay_tasks
+            models.Index(fields=['state', 'redline'], name='task_state_redline_idx'),
+            models.Index(fields=['state', 'deadline'], name='task_state_deadline_idx'),
+            # change feed, see tasks.changes
+            models.Index(fields=['last_modified', 'id'], name='task_modified_idx'),
+        ]
+
+    objects = TaskQuerySet.as_manager()
+    tracked_fields = ('project_id', 'sprint_id', 'state')
 
     STATUSES = (
         ('to-do', 'Not started'),
@@ -103,6 +213,14 @@ class Task(models.Model):
     def number(self):
         return f"{self.project.short_name}-{self.id}"
 
+    def get_effective_state(self, now=None):
+        now = now or timezone.now()
+        if self.state in OPEN_TASK_STATES + ('delay',) and self.deadline and self.deadline <= now:
+            return 'late'
+        if self.state in OPEN_TASK_STATES and self.redline and self.redline <= now:
+            return 'delay'
+        return self.state
+
     def __str__(self):
         return f"[{self.number}] {self.title} | Assignee: {self.employee}"
 
@@ -129,30 +247,115 @@ class Dates(models.Model):
         return f"{self.date.day}.{self.date.month} | {self.name}"
 
 
-class Employee(AbstractUser):
+# The ids of an employee's subtree walked along chief_id. UNION drops rows already found, so the walk also ends on
+# a cycle in the chief chain.
+SUBTREE_SQL = (
+    'WITH RECURSIVE subtree(id) AS ('
+    'SELECT id FROM {table} WHERE {anchor} = %s '
+    'UNION SELECT e.id FROM {table} e INNER JOIN subtree s ON e.chief_id = s.id'
+    ') SELECT id FROM subtree'
+)
+
+
+class SubtreeIds(RawSQL):
+    # Not wrapped in parentheses like RawSQL: `pk__in` adds its own, and SQLite takes a doubly wrapped
+    # subquery for a single value.
+    def __init__(self, employee_id, include_self):
+        super().__init__(SUBTREE_SQL, [employee_id], output_field=IntegerField())
+        self.anchor = 'id' if include_self else 'chief_id'
+
+    def as_sql(self, compiler, connection):
+        table = connection.ops.quote_name(Employee._meta.db_table)
+        return self.sql.format(table=table, anchor=self.anchor), self.params
+
+
+class EmployeeManager(UserManager):
+    def subordinates_of(self, employee, include_self=False):
+        if settings.HIERARCHY_BACKEND == 'cte':
+            # One recursive query over chief_id, without relying on hierarchy_path.
+            queryset = self.filter(pk__in=SubtreeIds(employee.pk, include_self))
+            if not include_self:
+                queryset = queryset.exclude(pk=employee.pk)
+            return queryset.order_by('pk')
+        # `hierarchy_path` lists the ids from the top of the org chart down to the employee ("/1/5/23/"),
+        # so the whole subtree is a single prefix lookup on an indexed column.
+        if not employee.hierarchy_path:
+            return self.filter(pk=employee.pk) if include_self else self.none()
+        queryset = self.filter(hierarchy_path__startswith=employee.hierarchy_path)
+        if not include_self:
+            queryset = queryset.exclude(pk=employee.pk)
+        return queryset.order_by('hierarchy_path')
+
+
+class Employee(LoadedValuesMixin, AbstractUser):
     class Meta:
         verbose_name = "Employee"
         verbose_name_plural = "Employees"
 
+    objects = EmployeeManager()
+    tracked_fields = ('chief_id', 'name', 'role')
+
     name = models.CharField("Full name", max_length=50, blank=False, null=False)
     role = models.CharField("Role", max_length=20, choices=ROLES, default=ROLES[0][0], blank=False, null=False)
     chief = models.ForeignKey('Employee', on_delete=models.SET_NULL, related_name='subordinates', null=True, blank=True,
                               verbose_name='Chief')
     birthday = models.DateField("Birthday", null=True, blank=True)
     dates = models.ManyToManyField('Dates', null=True, blank=True, verbose_name='Important dates')
+    # "/1/7/42/": ids from the top chief down to the employee, unbounded for deep org charts
+    hierarchy_path = models.TextField("Hierarchy path", db_index=True, editable=False, default='')
+
+    def clean(self):
+        super().clean()
+        if self.pk and self.chief and (self.chief == self or f"/{self.pk}/" in self.chief.hierarchy_path):
+            raise ValidationError({'chief': "Employee cannot report to themselves or to one of their subordinates"})
 
     def __str__(self):
         return self.name
 
 
-class Item(models.Model):
+class Item(LoadedValuesMixin, models.Model):
     class Meta:
         verbose_name = "Item"
         verbose_name_plural = "Items"
 
+    tracked_fields = ('task_id', 'is_done')
+
     task = models.ForeignKey(Task, on_delete=models.CASCADE)
     item_description = models.CharField("Description", max_length=200)
     is_done = models.BooleanField("Done", default=False)
 
     def __str__(self):
         return ''
+
+
+class Sweep(models.Model):
+    class Meta:
+        verbose_name = "Sweep"
+        verbose_name_plural = "Sweeps"
+
+    name = models.CharField("Name", max_length=50, unique=True)
+    started_at = models.DateTimeField("Started at", null=True)
+    finished_at = models.DateTimeField("Finished at", null=True)
+    updated = models.PositiveIntegerField("Updated rows", default=0)
+
+    def __str__(self):
+        return f"{self.name} | {self.finished_at}"
+
+
+class Tombstone(models.Model):
+    """
+    A deleted task, sprint or project, for the change feed in tasks.changes.
+    """
+    class Meta:
+        verbose_name = "Tombstone"
+        verbose_name_plural = "Tombstones"
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ]
+
+    model = models.CharField("Model", max_length=20)
+    object_id = models.PositiveIntegerField("Object id")
+    deleted_at = models.DateTimeField("Deletion date", default=timezone.now)
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} | {self.deleted_at}"
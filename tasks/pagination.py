@@ -0,0 +1,117 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ALL_VAR, ORDER_VAR, ChangeList
+from django.db import connections
+from django.utils.dateparse import parse_datetime
+
+CURSOR_VAR = 'cursor'
+
+# Below this many rows the planner estimate is too rough to show and COUNT(*) is cheap anyway.
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def keyset_pagination_enabled():
+    return settings.ADMIN_PAGINATION == 'keyset'
+
+
+def estimated_count(queryset):
+    # PostgreSQL: the planner row estimate (reltuples scaled by the selectivity of the filters) instead of COUNT(*).
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate >= ESTIMATED_COUNT_THRESHOLD:
+            return estimate, True
+    return queryset.count(), False
+
+
+def encode_cursor(direction, created_at, pk):
+    value = json.dumps([direction, created_at.isoformat(), pk])
+    return urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(value):
+    try:
+        direction, created_at, pk = json.loads(urlsafe_b64decode(value.encode()).decode())
+        created_at = parse_datetime(created_at)
+    except (Base64Error, TypeError, ValueError):
+        raise IncorrectLookupParameters(f"Invalid cursor {value!r}")
+    if direction not in ('next', 'previous') or created_at is None or not isinstance(pk, int):
+        raise IncorrectLookupParameters(f"Invalid cursor {value!r}")
+    return direction, created_at, pk
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Pages the default `-created_at` ordering on (created_at, id) instead of OFFSET, so every page costs the
+    same, and shows an estimated count. Searching, sorting by a column or "Show all" fall back to the regular
+    paginator.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Changing a filter, the search or the ordering starts again from the first page.
+        if not new_params or CURSOR_VAR not in new_params:
+            remove = [CURSOR_VAR] + list(remove or [])
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        # search results are ordered by relevance
+        self.keyset_pagination = not (self.query or ORDER_VAR in self.params or ALL_VAR in self.params)
+        if not self.keyset_pagination:
+            self.result_count_estimated = False
+            return super().get_results(request)
+
+        cursor = self.params.get(CURSOR_VAR)
+        direction, created_at, pk = decode_cursor(cursor) if cursor else ('next', None, None)
+        queryset = self.queryset
+        if direction == 'next':
+            if cursor:
+                queryset = queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, pk__gte=pk)
+            queryset = queryset.order_by('-created_at', '-pk')
+        else:
+            queryset = queryset.filter(created_at__gte=created_at).exclude(created_at=created_at, pk__lte=pk)
+            queryset = queryset.order_by('created_at', 'pk')
+        rows = list(queryset[:self.list_per_page + 1])
+        more = len(rows) > self.list_per_page
+        rows = rows[:self.list_per_page]
+        if direction == 'previous':
+            rows.reverse()
+
+        has_next = more if direction == 'next' else True
+        has_previous = bool(cursor) and (more if direction == 'previous' else True)
+        self.first_page_url = self.get_query_string() if cursor else None
+        first, last = (rows[0], rows[-1]) if rows else (None, None)
+        self.next_page_url = self.get_query_string({CURSOR_VAR: encode_cursor('next', last.created_at, last.pk)}) \
+            if rows and has_next else None
+        self.previous_page_url = self.get_query_string(
+            {CURSOR_VAR: encode_cursor('previous', first.created_at, first.pk)}) if rows and has_previous else None
+
+        self.result_count, self.result_count_estimated = estimated_count(self.queryset)
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = bool(self.next_page_url or self.previous_page_url)
+        self.paginator = None
+
+
+class KeysetPaginationMixin:
+    def get_changelist(self, request, **kwargs):
+        if keyset_pagination_enabled():
+            return KeysetChangeList
+        return super().get_changelist(request, **kwargs)
@@ -0,0 +1,74 @@
+import csv
+import tempfile
+
+from django.utils import timezone
+
+from tasks.lib import computed_status_mode
+from tasks.models import Task
+from tasks.transfer import Echo
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # XLSX reports are optional
+    Workbook = None
+
+REPORT_CHUNK_SIZE = 2000
+
+HEADERS = ('Number', 'Title', 'Project', 'Sprint', 'Assigned', 'Status', 'Priority', 'To be completed', 'Deadline',
+           'Creation date')
+
+
+def report_formats():
+    return ('csv', 'xlsx') if Workbook else ('csv',)
+
+
+def report_rows(queryset):
+    """
+    One row of display values per task, read from a single joined query in chunks, so neither the number
+    of queries nor memory use grows with the number of tasks.
+    """
+    state = 'effective_state' if computed_status_mode() else 'state'
+    states, priorities = dict(Task.STATUSES), dict(Task.PRIORITIES)
+    rows = queryset.values_list(
+        'pk', 'title', 'project__short_name', 'project__title', 'sprint__project__short_name', 'sprint__title',
+        'employee__name', state, 'priority', 'redline', 'deadline', 'created_at')
+    for (pk, title, short_name, project, sprint_short_name, sprint, employee, state, priority,
+         redline, deadline, created_at) in rows.iterator(REPORT_CHUNK_SIZE):
+        yield (
+            f"{short_name}-{pk}" if short_name else str(pk),
+            title,
+            project,
+            f"({sprint_short_name}) {sprint}" if sprint else None,
+            employee,
+            states.get(state, state),
+            priorities.get(priority, priority),
+            local_time(redline),
+            local_time(deadline),
+            local_time(created_at),
+        )
+
+
+def local_time(value):
+    # naive local time, which is what spreadsheets expect
+    return timezone.localtime(value).replace(tzinfo=None) if value else None
+
+
+def csv_report(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADERS)
+    for row in report_rows(queryset):
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def xlsx_report(queryset):
+    # A workbook is a zip archive and cannot be sent before it is complete; the write-only workbook keeps
+    # memory flat and the finished file is streamed from disk.
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Tasks')
+    sheet.append(HEADERS)
+    for row in report_rows(queryset):
+        sheet.append(row)
+    report = tempfile.TemporaryFile()
+    workbook.save(report)
+    report.seek(0)
+    return report
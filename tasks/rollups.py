@@ -0,0 +1,173 @@
+import threading
+from collections import Counter, defaultdict
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from tasks.models import Item, Project, Sprint, Task
+
+ROLLUP_FIELDS = ('tasks_total', 'tasks_done', 'tasks_delay', 'tasks_late', 'items_total', 'items_done')
+
+# Task state -> counter
+STATE_COUNTERS = {'done': 'tasks_done', 'delay': 'tasks_delay', 'late': 'tasks_late'}
+
+# Tasks being deleted: their items are subtracted together with the task instead of one by one.
+_deleting = threading.local()
+
+
+def deleting_tasks():
+    if not hasattr(_deleting, 'ids'):
+        _deleting.ids = set()
+    return _deleting.ids
+
+
+def task_counts(state, items_total=0, items_done=0):
+    counts = Counter(tasks_total=1, items_total=items_total, items_done=items_done)
+    if state in STATE_COUNTERS:
+        counts[STATE_COUNTERS[state]] += 1
+    return counts
+
+
+def item_counts(is_done):
+    return Counter(items_total=1, items_done=int(bool(is_done)))
+
+
+class RollupDelta:
+    # Collects the counter changes of one save or delete and writes them as a single relative UPDATE per
+    # sprint and project, so concurrent changes to other tasks are not lost.
+    def __init__(self):
+        self.changes = defaultdict(Counter)
+
+    def add(self, project_id, sprint_id, counts, sign=1):
+        for model, pk in ((Project, project_id), (Sprint, sprint_id)):
+            if pk is not None:
+                for field, value in counts.items():
+                    self.changes[model, pk][field] += sign * value
+
+    def save(self):
+        for (model, pk), counts in self.changes.items():
+            values = {field: F(field) + value for field, value in counts.items() if value}
+            if values:
+                model.objects.filter(pk=pk).update(**values)
+
+
+def count_items(task):
+    return task.item_set.aggregate(total=Count('pk'), done=Count('pk', filter=Q(is_done=True)))
+
+
+def task_saved(task, created):
+    location = (task.project_id, task.sprint_id)
+    if not created and not hasattr(task, '_loaded_values'):
+        # saved without being loaded, the previous values are unknown
+        recompute_rollups([task.sprint_id], [task.project_id])
+        return
+    delta = RollupDelta()
+    if created:
+        delta.add(*location, task_counts(task.state))
+    else:
+        old_location = (task.loaded_value('project_id'), task.loaded_value('sprint_id'))
+        old_state = task.loaded_value('state')
+        if old_location != location:
+            items = count_items(task)
+            delta.add(*old_location, task_counts(old_state, items['total'], items['done']), -1)
+            delta.add(*location, task_counts(task.state, items['total'], items['done']))
+        elif old_state != task.state:
+            delta.add(*location, task_counts(old_state), -1)
+            delta.add(*location, task_counts(task.state))
+    delta.save()
+
+
+def task_deleting(task):
+    items = count_items(task)
+    delta = RollupDelta()
+    delta.add(task.project_id, task.sprint_id, task_counts(task.state, items['total'], items['done']), -1)
+    delta.save()
+    deleting_tasks().add(task.pk)
+
+
+def task_deleted(task):
+    deleting_tasks().discard(task.pk)
+
+
+def locate_task(task_id):
+    # (project_id, sprint_id) as stored; a cached item.task may have been moved since
+    return Task.objects.filter(pk=task_id).values_list('project_id', 'sprint_id').first()
+
+
+def item_saved(item, created):
+    if not created and not hasattr(item, '_loaded_values'):
+        recompute_task_rollups(Task.objects.filter(pk=item.task_id))
+        return
+    old_task_id, old_done = item.loaded_value('task_id'), item.loaded_value('is_done')
+    if not created and old_task_id == item.task_id and bool(old_done) == item.is_done:
+        return
+    delta = RollupDelta()
+    if not created:
+        location = locate_task(old_task_id)
+        if location:
+            delta.add(*location, item_counts(old_done), -1)
+    location = locate_task(item.task_id)
+    if location:
+        delta.add(*location, item_counts(item.is_done))
+    delta.save()
+
+
+def item_deleted(item):
+    if item.task_id in deleting_tasks():
+        return
+    location = locate_task(item.task_id)
+    if location:
+        delta = RollupDelta()
+        delta.add(*location, item_counts(item.is_done), -1)
+        delta.save()
+
+
+def count(queryset, aggregate):
+    return Coalesce(Subquery(queryset.annotate(count=aggregate).values('count')), 0)
+
+
+def recompute_rollups(sprint_ids=None, project_ids=None, using=DEFAULT_DB_ALIAS):
+    """
+    Recounts the counters of the given sprints and projects, or of all of them, from the tasks and items:
+    one UPDATE with correlated subqueries per model.
+    """
+    for name, model, ids in (('sprint', Sprint, sprint_ids), ('project', Project, project_ids)):
+        ids = None if ids is None else set(ids) - {None}
+        if ids is not None and not ids:
+            continue
+        queryset = model.objects.using(using)
+        if ids is not None:
+            queryset = queryset.filter(pk__in=ids)
+        tasks = Task.objects.filter(**{name: OuterRef('pk')}).order_by().values(name)
+        items = Item.objects.filter(**{f'task__{name}': OuterRef('pk')}).order_by().values(f'task__{name}')
+        queryset.update(
+            tasks_total=count(tasks, Count('pk')),
+            tasks_done=count(tasks, Count('pk', filter=Q(state='done'))),
+            tasks_delay=count(tasks, Count('pk', filter=Q(state='delay'))),
+            tasks_late=count(tasks, Count('pk', filter=Q(state='late'))),
+            items_total=count(items, Count('pk')),
+            items_done=count(items, Count('pk', filter=Q(is_done=True))),
+        )
+
+
+def task_locations(tasks):
+    # sprint and project ids of a task queryset, for recompute_rollups
+    rows = set(tasks.order_by().values_list('sprint_id', 'project_id').distinct())
+    return {sprint_id for sprint_id, project_id in rows}, {project_id for sprint_id, project_id in rows}
+
+
+def recompute_task_rollups(tasks):
+    recompute_rollups(*task_locations(tasks))
+
+
+def reconcile_rollups():
+    # Recounts everything and returns how many sprints and projects had drifted.
+    drifted = {}
+    snapshots = {model: dict((row[0], row[1:]) for row in model.objects.values_list('pk', *ROLLUP_FIELDS))
+                 for model in (Sprint, Project)}
+    recompute_rollups()
+    for model, before in snapshots.items():
+        after = model.objects.values_list('pk', *ROLLUP_FIELDS)
+        drifted[model._meta.model_name] = sum(1 for row in after if before.get(row[0]) != row[1:])
+    return drifted
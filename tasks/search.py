@@ -0,0 +1,170 @@
+import re
+
+from django.db import connections
+from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+SEARCH_FIELDS = ('title', 'description', 'accept_criterion')
+
+# Searched like the admin search_fields, every word in the assignee's name or one of these choices, next to the
+# full text match.
+EXTRA_SEARCH_FIELDS = ('priority', 'state')
+
+# "PM-12" or "12", as shown in the Task number column
+NUMBER = re.compile(r'^(?:(\w+)-)?(\d{1,18})$')
+
+# a task found by its number comes before text matches
+NUMBER_RANK = 1e9
+
+# PostgreSQL: a GIN index over the tsvector expression. The query has to repeat the expression exactly for the
+# planner to use the index. The `simple` configuration does no stemming and so works for any language; prefix
+# matching covers word forms instead.
+POSTGRES_VECTOR = "to_tsvector('simple', {})".format(
+    " || ' ' || ".join(f"coalesce({{table}}{field}, '')" for field in SEARCH_FIELDS))
+
+POSTGRES_INDEX = [
+    'CREATE INDEX IF NOT EXISTS task_search_idx ON tasks_task USING GIN ({})'.format(
+        POSTGRES_VECTOR.format(table='')),
+]
+
+POSTGRES_DROP_INDEX = ['DROP INDEX IF EXISTS task_search_idx']
+
+# SQLite: an FTS5 table over the task columns, kept in sync by triggers.
+SQLITE_COLUMNS = ', '.join(SEARCH_FIELDS)
+SQLITE_NEW = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+SQLITE_OLD = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+
+SQLITE_TABLE = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS tasks_task_fts USING fts5({SQLITE_COLUMNS}, content='tasks_task', "
+    f"content_rowid='id')",
+]
+
+SQLITE_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS tasks_task_fts_insert AFTER INSERT ON tasks_task BEGIN "
+    f"INSERT INTO tasks_task_fts(rowid, {SQLITE_COLUMNS}) VALUES (new.id, {SQLITE_NEW}); END",
+    f"CREATE TRIGGER IF NOT EXISTS tasks_task_fts_delete AFTER DELETE ON tasks_task BEGIN "
+    f"INSERT INTO tasks_task_fts(tasks_task_fts, rowid, {SQLITE_COLUMNS}) VALUES ('delete', old.id, {SQLITE_OLD}); "
+    f"END",
+    f"CREATE TRIGGER IF NOT EXISTS tasks_task_fts_update AFTER UPDATE OF {SQLITE_COLUMNS} ON tasks_task BEGIN "
+    f"INSERT INTO tasks_task_fts(tasks_task_fts, rowid, {SQLITE_COLUMNS}) VALUES ('delete', old.id, {SQLITE_OLD}); "
+    f"INSERT INTO tasks_task_fts(rowid, {SQLITE_COLUMNS}) VALUES (new.id, {SQLITE_NEW}); END",
+]
+
+SQLITE_REBUILD = ["INSERT INTO tasks_task_fts(tasks_task_fts) VALUES ('rebuild')"]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS tasks_task_fts_insert',
+    'DROP TRIGGER IF EXISTS tasks_task_fts_delete',
+    'DROP TRIGGER IF EXISTS tasks_task_fts_update',
+    'DROP TABLE IF EXISTS tasks_task_fts',
+]
+
+
+def execute(connection, statements):
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def create_search_index(connection):
+    if connection.vendor == 'postgresql':
+        execute(connection, POSTGRES_INDEX)
+    elif connection.vendor == 'sqlite':
+        execute(connection, SQLITE_TABLE + SQLITE_TRIGGERS + SQLITE_REBUILD)
+
+
+def drop_search_index(connection):
+    if connection.vendor == 'postgresql':
+        execute(connection, POSTGRES_DROP_INDEX)
+    elif connection.vendor == 'sqlite':
+        execute(connection, SQLITE_DROP)
+
+
+def restore_search_triggers(connection):
+    # SQLite migrations that alter tasks_task rebuild the table, which drops its triggers.
+    if connection.vendor != 'sqlite' or 'tasks_task_fts' not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'tasks_task_fts_%'")
+        if cursor.fetchone()[0] == len(SQLITE_TRIGGERS):
+            return
+    execute(connection, SQLITE_TRIGGERS + SQLITE_REBUILD)
+
+
+def search_available(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and 'tasks_task_fts' in connection.introspection.table_names()
+
+
+def search_words(term):
+    return re.findall(r'\w+', term.lower())
+
+
+class MatchingIds(RawSQL):
+    # A subquery for `pk__in`, which adds the parentheses itself, see tasks.models.SubtreeIds.
+    def __init__(self, sql, params):
+        super().__init__(sql, params, output_field=IntegerField())
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def search_tasks(queryset, term):
+    """
+    Tasks matching every word of `term` as a prefix in the title, description or acceptance criterion, or
+    every word in the assignee's name, priority or state, annotated with `search_rank` (higher is better).
+    A task number matches that task as well.
+
+    The full text match is a subquery on the task table alone, so it is answered from the search index; the
+    other matches compare columns of the task row and join nothing.
+    """
+    words = search_words(term)
+    if not words:
+        return queryset.none()
+
+    model = queryset.model
+    connection = connections[queryset.db]
+    table, pk = connection.ops.quote_name(model._meta.db_table), connection.ops.quote_name(model._meta.pk.column)
+    if connection.vendor == 'postgresql':
+        query = ' & '.join(f'{word}:*' for word in words)
+        found = MatchingIds(f"SELECT {pk} FROM {table} WHERE {POSTGRES_VECTOR.format(table='')} "
+                            f"@@ to_tsquery('simple', %s)", [query])
+        rank = RawSQL(f"ts_rank({POSTGRES_VECTOR.format(table=f'{table}.')}, to_tsquery('simple', %s))", [query],
+                      output_field=FloatField())
+    else:
+        query = ' '.join(f'"{word}"*' for word in words)
+        found = MatchingIds('SELECT rowid FROM tasks_task_fts WHERE tasks_task_fts MATCH %s', [query])
+        # bm25() is lower for better matches
+        rank = RawSQL(f'SELECT -bm25(tasks_task_fts) FROM tasks_task_fts WHERE tasks_task_fts MATCH %s '
+                      f'AND rowid = {table}.{pk}', [query], output_field=FloatField())
+    rank = Coalesce(rank, Value(0.0))
+
+    matches = Q(pk__in=found) | extra_matches(model, words)
+
+    number = NUMBER.match(term.strip())
+    if number:
+        prefix, number = number.groups()
+        is_number = Q(pk=int(number))
+        if prefix:
+            projects = model._meta.get_field('project').related_model.objects.filter(short_name__iexact=prefix)
+            is_number &= Q(project_id__in=projects.values('pk'))
+        matches |= is_number
+        rank = Case(When(is_number, then=Value(NUMBER_RANK)), default=rank, output_field=FloatField())
+    return queryset.annotate(search_rank=rank).filter(matches)
+
+
+def extra_matches(model, words):
+    # Priorities and states are matched against their choices here, and names in a subquery on the employees,
+    # so that no LIKE runs over the task table.
+    employees = model._meta.get_field('employee').related_model.objects
+    matches = Q()
+    for word in words:
+        matches_word = Q(employee_id__in=employees.filter(name__icontains=word).values('pk'))
+        for field in EXTRA_SEARCH_FIELDS:
+            values = [value for value, label in model._meta.get_field(field).choices if word in value.lower()]
+            if values:
+                matches_word |= Q(**{f'{field}__in': values})
+        matches &= matches_word
+    return matches
@@ -0,0 +1,118 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from tasks.cache import HIERARCHY, bump_versions, invalidate_subordinates, parent_path, project_scope
+from tasks.changes import record_deletion, touch
+from tasks.graph import check_sub_tasks
+from tasks.lib import sync_employee_hierarchy, move_employee_subtree
+from tasks.models import Employee, Item, Project, Sprint, Task
+from tasks.rollups import item_deleted, item_saved, task_deleted, task_deleting, task_saved
+
+
+@receiver(post_save, sender=Employee)
+def employee_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    changed = instance.changed_fields()
+    old_path = instance.hierarchy_path
+    if created or not old_path or 'chief_id' in changed:
+        old_path = sync_employee_hierarchy(instance)
+    if changed == {'chief_id'}:
+        # The employee's own subtree is unchanged, only the chiefs above it gain or lose rows.
+        invalidate_subordinates(parent_path(old_path), parent_path(instance.hierarchy_path))
+        bump_versions(HIERARCHY)
+    elif created or changed:
+        invalidate_subordinates(old_path, instance.hierarchy_path)
+        bump_versions(HIERARCHY)
+    instance.remember_loaded_values()
+
+
+@receiver(post_delete, sender=Employee)
+def employee_deleted(sender, instance, **kwargs):
+    # Direct subordinates had `chief` set to NULL, so the whole subtree is re-rooted.
+    if instance.hierarchy_path:
+        move_employee_subtree(instance.hierarchy_path, '/')
+    invalidate_subordinates(instance.hierarchy_path)
+    bump_versions(HIERARCHY)
+
+
+@receiver(post_save, sender=Sprint)
+@receiver(post_save, sender=Task)
+def project_item_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if sender is Task:
+        # before the loaded values are replaced below
+        task_saved(instance, created)
+    bump_versions(project_scope(instance.project_id), project_scope(instance.loaded_value('project_id')))
+    instance.remember_loaded_values()
+
+
+@receiver(post_delete, sender=Sprint)
+@receiver(post_delete, sender=Task)
+def project_item_deleted(sender, instance, **kwargs):
+    if sender is Task:
+        task_deleted(instance)
+    bump_versions(project_scope(instance.project_id))
+
+
+@receiver(pre_delete, sender=Task)
+def task_being_deleted(sender, instance, **kwargs):
+    # the items are still there to be counted
+    task_deleting(instance)
+
+
+@receiver(post_save, sender=Item)
+def checklist_item_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    item_saved(instance, created)
+    instance.remember_loaded_values()
+
+
+@receiver(post_delete, sender=Item)
+def checklist_item_deleted(sender, instance, **kwargs):
+    item_deleted(instance)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def project_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_versions(project_scope(instance.pk))
+
+
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Sprint)
+@receiver(post_delete, sender=Task)
+def tracked_object_deleted(sender, instance, using, **kwargs):
+    record_deletion(instance, using)
+
+
+@receiver(m2m_changed, sender=Project.employees.through)
+def project_employees_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_versions(project_scope(instance.pk))
+            touch(Project, [instance.pk], using)
+        return
+    # employee.employee_projects was changed
+    if action == 'pre_clear':
+        pk_set = list(instance.employee_projects.values_list('pk', flat=True))
+    elif action not in ('post_add', 'post_remove'):
+        return
+    bump_versions(*[project_scope(pk) for pk in pk_set])
+    touch(Project, pk_set, using)
+
+
+@receiver(m2m_changed, sender=Task.sub_tasks.through)
+def sub_tasks_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    # A link that would close a cycle raises TaskCycleError before anything is added.
+    if action == 'pre_add':
+        check_sub_tasks(instance, pk_set, reverse=reverse, using=using)
+    # both ends of a link show up in the change feed
+    elif action in ('post_add', 'post_remove'):
+        touch(Task, {instance.pk} | pk_set, using)
+    elif action == 'pre_clear':
+        linked = instance.parent_task if reverse else instance.sub_tasks
+        touch(Task, [instance.pk, *linked.values_list('pk', flat=True)], using)
@@ -0,0 +1,76 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from tasks.lib import computed_status_mode, delay_tasks, delay_sprints, delay_projects
+from tasks.models import Sweep
+
+logger = logging.getLogger(__name__)
+
+OVERDUE_SWEEP = 'overdue'
+
+_scheduler = None
+
+
+def sweep_overdue(batch_size=None):
+    if computed_status_mode():
+        # delay and late are computed when the rows are read, there is nothing to write
+        logger.info("Overdue sweep skipped, OVERDUE_STATUS_MODE is 'computed'")
+        return 0
+    batch_size = batch_size or settings.OVERDUE_SWEEP_BATCH_SIZE
+    started_at = timezone.now()
+    updated = delay_tasks(batch_size) + delay_sprints(batch_size) + delay_projects(batch_size)
+    Sweep.objects.update_or_create(name=OVERDUE_SWEEP, defaults={
+        'started_at': started_at,
+        'finished_at': timezone.now(),
+        'updated': updated,
+    })
+    logger.info("Overdue sweep updated %s rows in %s", updated, timezone.now() - started_at)
+    return updated
+
+
+def last_sweep():
+    return Sweep.objects.filter(name=OVERDUE_SWEEP).first()
+
+
+def sweep_is_due(interval):
+    sweep = last_sweep()
+    return sweep is None or sweep.finished_at is None or \
+        sweep.finished_at <= timezone.now() - timedelta(seconds=interval)
+
+
+class SweepScheduler(threading.Thread):
+    def __init__(self, interval, batch_size=None):
+        super().__init__(name='overdue-sweeper', daemon=True)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            close_old_connections()
+            try:
+                # Every worker process runs its own scheduler; whoever comes first sweeps for everybody.
+                if sweep_is_due(self.interval):
+                    sweep_overdue(self.batch_size)
+            except Exception:
+                logger.exception("Overdue sweep failed")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_scheduler(interval=None, batch_size=None):
+    global _scheduler
+    interval = interval or settings.OVERDUE_SWEEP_INTERVAL
+    if not interval or computed_status_mode() or _scheduler is not None:
+        return _scheduler
+    _scheduler = SweepScheduler(interval, batch_size)
+    _scheduler.start()
+    return _scheduler
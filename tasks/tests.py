@@ -1,3 +1,1189 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from pm.db.backends.sqlite3.base import DatabaseWrapper as PooledSQLiteWrapper
+from pm.db.pool import ConnectionPool, PoolTimeout, close_pools, get_pool
+from pm.metrics import metrics_view
+from tasks.admin import TaskAdmin
+from tasks.cache import hierarchy_cache_stats, subordinates_key
+from tasks.forms import TaskForm
+from tasks.graph import TaskCycleError, TaskGraph
+from tasks.lib import get_employee_subordinates, get_subordinate_ids, get_subordinate_rows, rebuild_hierarchy_paths
+from tasks.models import Employee, Item, Project, Sprint, Task, Tombstone, OPEN_STATUSES, OPEN_TASK_STATES
+from tasks.pagination import CURSOR_VAR
+from tasks.rollups import ROLLUP_FIELDS, reconcile_rollups
+from tasks.search import search_tasks
+from tasks.sweeper import last_sweep, sweep_overdue
+
+
+def create_employee(username, chief=None, role='dev'):
+    return Employee.objects.create(username=username, name=username.title(), role=role, chief=chief,
+                                   is_staff=True, is_superuser=True)
+
+
+def create_project(created_by, short_name='PM', employees=()):
+    project = Project.objects.create(title=short_name, short_name=short_name, date_start=date.today(),
+                                     date_end=date.today() + timedelta(days=30), status='open', created_by=created_by)
+    project.employees.set(employees)
+    return project
+
+
+def create_task(project, employee, title='Task', **kwargs):
+    kwargs.setdefault('redline', timezone.now() + timedelta(days=7))
+    kwargs.setdefault('deadline', timezone.now() + timedelta(days=14))
+    return Task.objects.create(project=project, employee=employee, title=title, created_by=project.created_by,
+                               **kwargs)
+
+
+class EmployeeHierarchyTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.lead = create_employee('devlead', chief=self.pm, role='lead_dev')
+        self.area = create_employee('devarealead', chief=self.lead, role='area_dev')
+        self.dev = create_employee('developer', chief=self.area)
+        self.analyst = create_employee('analyst', chief=self.pm, role='analyst')
+
+    def test_subordinates(self):
+        self.assertEqual(set(get_employee_subordinates(self.pm)), {self.lead, self.area, self.dev, self.analyst})
+        self.assertEqual(set(get_employee_subordinates(self.lead, include_self=True)), {self.lead, self.area, self.dev})
+        self.assertFalse(get_employee_subordinates(self.dev).exists())
+
+    def test_subordinates_single_query(self):
+        with self.assertNumQueries(1):
+            list(get_employee_subordinates(self.pm, include_self=True))
+
+    def test_chief_change_moves_subtree(self):
+        self.area.chief = self.analyst
+        self.area.save()
+        self.dev.refresh_from_db()
+        self.assertEqual(self.dev.hierarchy_path, f"/{self.pm.pk}/{self.analyst.pk}/{self.area.pk}/{self.dev.pk}/")
+        self.assertEqual(set(get_employee_subordinates(self.analyst)), {self.area, self.dev})
+        self.assertEqual(set(get_employee_subordinates(self.lead)), set())
+
+    def test_delete_reroots_subtree(self):
+        self.lead.delete()
+        self.dev.refresh_from_db()
+        self.assertEqual(self.dev.hierarchy_path, f"/{self.area.pk}/{self.dev.pk}/")
+        self.assertEqual(set(get_employee_subordinates(self.pm)), {self.analyst})
+
+    def test_cycle_is_rejected(self):
+        self.lead.chief = self.dev
+        with self.assertRaises(ValidationError):
+            self.lead.full_clean(exclude=('password',))
+
+    def test_rebuild(self):
+        Employee.objects.update(hierarchy_path='')
+        self.assertEqual(rebuild_hierarchy_paths(), 5)
+        self.assertEqual(set(get_employee_subordinates(self.lead)), {self.area, self.dev})
+
+
+@override_settings(HIERARCHY_BACKEND='cte')
+class CteHierarchyTest(EmployeeHierarchyTest):
+    def test_chief_cycle(self):
+        # a cycle written behind the signals' back still ends the walk
+        Employee.objects.filter(pk=self.pm.pk).update(chief=self.dev)
+        self.assertEqual(set(get_employee_subordinates(self.lead)), {self.area, self.dev, self.pm, self.analyst})
+
+
+class TaskVisibilityTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.lead = create_employee('devlead', chief=self.pm, role='lead_dev')
+        self.dev = create_employee('developer', chief=self.lead)
+        self.other = create_employee('analyst', role='analyst')
+        project = create_project(self.pm, employees=(self.lead, self.dev, self.other))
+        self.pm_task = create_task(project, self.pm)
+        self.lead_task = create_task(project, self.lead)
+        self.dev_task = create_task(project, self.dev)
+        self.other_task = create_task(project, self.other)
+
+    def test_visible_to(self):
+        self.assertEqual(set(Task.objects.visible_to(self.pm)), {self.pm_task, self.lead_task, self.dev_task})
+        self.assertEqual(set(Task.objects.visible_to(self.lead, include_self=False)), {self.dev_task})
+        self.assertEqual(set(Task.objects.visible_to(self.dev)), {self.dev_task})
+
+    def test_visible_to_is_single_query(self):
+        with self.assertNumQueries(1):
+            list(Task.objects.visible_to(self.pm))
+
+    def test_role_filter(self):
+        self.client.force_login(self.pm)
+        response = self.client.get('/tasks/task/', {'employee__role': 'dev'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.dev_task])
+
+
+@override_settings(HIERARCHY_BACKEND='cte')
+class CteTaskVisibilityTest(TaskVisibilityTest):
+    pass
+
+
+@override_settings(OVERDUE_STATUS_MODE='persisted')
+class OverdueSweepTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.dev = create_employee('developer', chief=self.pm)
+        self.project = create_project(self.pm, employees=(self.dev,))
+        self.sprint = Sprint.objects.create(project=self.project, title='Sprint', status='in_progress',
+                                            created_by=self.pm, date_start=date.today() - timedelta(days=14),
+                                            redline=date.today() - timedelta(days=2),
+                                            date_end=date.today() + timedelta(days=1))
+        now = timezone.now()
+        self.delayed = [create_task(self.project, self.dev, redline=now - timedelta(hours=1)) for _ in range(3)]
+        self.late = create_task(self.project, self.dev, state='delay', redline=now - timedelta(days=2),
+                                deadline=now - timedelta(days=1))
+        self.done = create_task(self.project, self.dev, state='done', redline=now - timedelta(days=2),
+                                deadline=now - timedelta(days=1))
+        self.on_time = create_task(self.project, self.dev)
+
+    def test_sweep(self):
+        self.assertEqual(sweep_overdue(batch_size=2), 5)
+        states = dict(Task.objects.values_list('pk', 'state'))
+        self.assertEqual({states[t.pk] for t in self.delayed}, {'delay'})
+        self.assertEqual(states[self.late.pk], 'late')
+        self.assertEqual(states[self.done.pk], 'done')
+        self.assertEqual(states[self.on_time.pk], 'to-do')
+        self.sprint.refresh_from_db()
+        self.assertEqual(self.sprint.status, 'delay')
+        self.assertEqual(last_sweep().updated, 5)
+        self.assertEqual(sweep_overdue(), 0)
+
+    def test_changelist_is_read_only(self):
+        self.client.force_login(self.pm)
+        for url in ('/tasks/task/', '/tasks/sprint/', '/tasks/project/'):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE')], url)
+
+    def test_change_form_is_read_only(self):
+        self.client.force_login(self.pm)
+        # the form keeps the stored status, the overdue-aware one is shown read-only
+        for url, field, stored, current in (
+                (f'/tasks/task/{self.late.pk}/change/', 'state', 'delay', 'Being late'),
+                (f'/tasks/task/{self.delayed[0].pk}/change/', 'state', 'to-do', 'Delayed'),
+                (f'/tasks/sprint/{self.sprint.pk}/change/', 'status', 'in_progress', 'Delayed'),
+                (f'/tasks/project/{self.project.pk}/change/', 'status', 'open', 'Not started')):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.context['adminform'].form.initial[field], stored, url)
+            self.assertContains(response, f'<div class="readonly">{current}</div>', html=True)
+            self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE "tasks_')], url)
+        self.assertEqual(Task.objects.get(pk=self.late.pk).state, 'delay')
+
+
+@override_settings(OVERDUE_STATUS_MODE='computed')
+class ComputedStatusTest(OverdueSweepTest):
+    def test_sweep(self):
+        with self.assertLogs('tasks.sweeper', 'INFO'):
+            call_command('sweep_overdue', stdout=StringIO())
+        self.assertEqual(Task.objects.filter(state__in=('delay', 'late')).count(), 1)
+        self.assertIsNone(last_sweep())
+
+    def test_effective_state(self):
+        tasks = Task.objects.with_effective_state()
+        self.assertEqual(set(tasks.filter(effective_state='delay')), set(self.delayed))
+        self.assertEqual(list(tasks.filter(effective_state='late')), [self.late])
+        self.assertEqual(set(tasks.filter(effective_state='to-do')), {self.on_time})
+        self.assertEqual(Sprint.objects.with_effective_status().get().effective_status, 'delay')
+        self.assertEqual(self.late.get_effective_state(), 'late')
+        self.assertEqual(self.sprint.get_effective_status(), 'delay')
+
+    def test_changelist_filter(self):
+        self.client.force_login(self.pm)
+        response = self.client.get('/tasks/task/', {'effective_state': 'delay', 'o': '10'})
+        self.assertEqual(set(response.context['cl'].result_list), set(self.delayed))
+        self.assertContains(response, 'Delayed')
+        response = self.client.get('/tasks/sprint/', {'effective_status': 'delay'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.sprint])
+
+    def test_stored_overdue_counters_are_hidden(self):
+        self.client.force_login(self.pm)
+        for url in ('/tasks/sprint/', '/tasks/project/'):
+            response = self.client.get(url)
+            self.assertNotContains(response, 'Delayed tasks')
+            self.assertNotContains(response, 'Late tasks')
+            self.assertContains(response, 'Tasks done')
+
+    def test_change_form_is_read_only(self):
+        self.client.force_login(self.pm)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/tasks/task/{self.late.pk}/change/')
+        self.assertEqual(response.context['adminform'].form.initial['state'], 'delay')
+        self.assertContains(response, '<div class="readonly">Being late</div>', html=True)
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE')])
+        self.late.refresh_from_db()
+        self.assertEqual(self.late.state, 'delay')
+
+
+class OptionsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.pm = create_employee('manager', role='pm')
+        self.lead = create_employee('devlead', chief=self.pm, role='lead_dev')
+        self.project = create_project(self.pm, employees=(self.lead,))
+        self.sprint = Sprint.objects.create(project=self.project, title='Sprint 1', status='open', created_by=self.pm,
+                                            date_start=date.today(), date_end=date.today() + timedelta(days=14))
+        self.task = create_task(self.project, self.lead)
+        self.client.force_login(self.pm)
+
+    def get_options(self, **headers):
+        return self.client.get('/api/options', {'id': self.project.pk}, **headers)
+
+    def test_options(self):
+        self.assertEqual(self.get_options().json(), [
+            [[self.sprint.pk, '(PM) Sprint 1']],
+            [[self.lead.pk, 'Devlead']],
+            [[self.task.pk, f'[PM-{self.task.pk}] Task | Assignee: Devlead']],
+        ])
+
+    def test_query_count_does_not_grow(self):
+        for i in range(10):
+            dev = create_employee(f'developer{i}', chief=self.lead)
+            self.project.employees.add(dev)
+            create_task(self.project, dev)
+            Sprint.objects.create(project=self.project, title=f'Sprint {i + 2}', status='open', created_by=self.pm,
+                                  date_start=date.today(), date_end=date.today() + timedelta(days=14))
+        cache.clear()
+        # session + user, then project, sprints, employees and tasks
+        with self.assertNumQueries(6):
+            response = self.get_options()
+        self.assertEqual([len(options) for options in response.json()], [11, 11, 11])
+
+    def test_cached_response_and_etag(self):
+        etag = self.get_options()['ETag']
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_options().status_code, 200)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_options(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_invalidation(self):
+        etag = self.get_options()['ETag']
+        sprint = Sprint.objects.create(project=self.project, title='Sprint 2', status='open', created_by=self.pm,
+                                       date_start=date.today(), date_end=date.today() + timedelta(days=14))
+        response = self.get_options(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn([sprint.pk, '(PM) Sprint 2'], response.json()[0])
+
+        self.project.employees.remove(self.lead)
+        self.assertEqual(self.get_options().json()[1], [])
+
+        dev = create_employee('developer', chief=self.lead)
+        self.lead.employee_projects.add(self.project)
+        dev.employee_projects.add(self.project)
+        self.assertEqual(len(self.get_options().json()[1]), 2)
+
+
+class RequestMemoizationTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.lead = create_employee('devlead', chief=self.pm, role='lead_dev')
+        self.dev = create_employee('developer', chief=self.lead)
+        self.task = create_task(create_project(self.pm, employees=(self.lead, self.dev)), self.dev)
+        self.client.force_login(self.pm)
+
+    def hierarchy_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [q for q in queries if q['sql'].startswith('SELECT "tasks_employee"."id", "tasks_employee"."name"')]
+
+    def test_subordinates_loaded_once_per_request(self):
+        self.assertEqual(len(self.hierarchy_queries('/tasks/task/')), 1)
+        self.assertEqual(len(self.hierarchy_queries(f'/tasks/task/{self.task.pk}/change/')), 1)
+
+
+class HierarchyCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.pm = create_employee('manager', role='pm')
+        self.lead = create_employee('devlead', chief=self.pm, role='lead_dev')
+        self.dev = create_employee('developer', chief=self.lead)
+        self.analyst = create_employee('analyst', chief=self.pm, role='analyst')
+
+    def subordinate_ids(self, employee):
+        # A fresh instance, as on a new request.
+        return get_subordinate_ids(Employee.objects.get(pk=employee.pk))
+
+    def test_hits_and_misses(self):
+        before = hierarchy_cache_stats()
+        self.subordinate_ids(self.pm)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.subordinate_ids(self.pm), {self.lead.pk, self.dev.pk, self.analyst.pk})
+        after = hierarchy_cache_stats()
+        self.assertEqual(after['miss'] - before['miss'], 1)
+        self.assertEqual(after['hit'] - before['hit'], 1)
+
+    def test_chief_change_invalidates_old_and_new_chiefs_only(self):
+        for employee in (self.pm, self.lead, self.dev, self.analyst):
+            self.subordinate_ids(employee)
+        self.dev.chief = self.analyst
+        self.dev.save()
+        self.assertIsNotNone(cache.get(subordinates_key(self.dev.pk)))
+        self.assertIsNone(cache.get(subordinates_key(self.lead.pk)))
+        self.assertIsNone(cache.get(subordinates_key(self.analyst.pk)))
+        self.assertEqual(self.subordinate_ids(self.lead), set())
+        self.assertEqual(self.subordinate_ids(self.analyst), {self.dev.pk})
+
+    def test_delete_and_rename_invalidate(self):
+        self.subordinate_ids(self.pm)
+        self.dev.delete()
+        self.assertEqual(self.subordinate_ids(self.pm), {self.lead.pk, self.analyst.pk})
+        self.client.force_login(self.pm)
+        self.lead.name = 'Renamed'
+        self.lead.save()
+        self.assertIn((self.lead.pk, 'Renamed', 'lead_dev'), get_subordinate_rows(self.pm))
+
+    def test_login_does_not_invalidate(self):
+        self.subordinate_ids(self.pm)
+        self.client.force_login(self.pm)
+        self.assertIsNotNone(cache.get(subordinates_key(self.pm.pk)))
+
+
+class FileHierarchyCacheTest(HierarchyCacheTest):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        caches = self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                                   'LOCATION': directory.name}})
+        caches.enable()
+        self.addCleanup(caches.disable)
+        super().setUp()
+
+
+class QueryBudgetTest(TestCase):
+    # Admin pages must not issue per-row queries: the count may not grow with the number of rows
+    # and has to stay within a fixed budget.
+    budgets = {
+        '/tasks/task/': 30,
+        '/tasks/sprint/': 20,
+        '/tasks/project/': 20,
+    }
+    change_form_budget = 40
+
+    def setUp(self):
+        cache.clear()
+        self.pm = create_employee('manager', role='pm')
+        self.lead = create_employee('devlead', chief=self.pm, role='lead_dev')
+        self.devs = [create_employee(f'developer{i}', chief=self.lead) for i in range(3)]
+        self.project = create_project(self.pm, employees=[self.lead] + self.devs)
+        self.task = create_task(self.project, self.devs[0])
+        self.rows = 0
+
+    def populate(self, rows):
+        for i in range(self.rows, rows):
+            sprint = Sprint.objects.create(project=self.project, title=f'Sprint {i}', status='open', created_by=self.pm,
+                                           date_start=date.today(), date_end=date.today() + timedelta(days=14))
+            task = create_task(self.project, self.devs[i % len(self.devs)], sprint=sprint, title=f'Task {i}')
+            self.task.sub_tasks.add(task)
+            # more projects with sprints of their own grow the project and sprint filter choices
+            project = create_project(self.pm, short_name=f'P{i}', employees=[self.lead])
+            Sprint.objects.create(project=project, title=f'Sprint {i}', status='open', created_by=self.pm,
+                                  date_start=date.today(), date_end=date.today() + timedelta(days=14))
+        self.rows = rows
+
+    def count_queries(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def assert_flat(self, user, url, budget):
+        self.populate(5)
+        self.count_queries(user, url)  # warms up the content types cache
+        small = self.count_queries(user, url)
+        self.populate(25)
+        large = self.count_queries(user, url)
+        self.assertEqual(small, large, url)
+        self.assertLessEqual(large, budget, url)
+
+    def test_task_changelist(self):
+        self.assert_flat(self.pm, '/tasks/task/', self.budgets['/tasks/task/'])
+
+    def test_sprint_changelist(self):
+        self.assert_flat(self.pm, '/tasks/sprint/', self.budgets['/tasks/sprint/'])
+
+    def test_project_changelist(self):
+        self.assert_flat(self.pm, '/tasks/project/', self.budgets['/tasks/project/'])
+
+    def test_task_changelist_for_lead(self):
+        self.assert_flat(self.lead, '/tasks/task/', self.budgets['/tasks/task/'])
+
+    def test_task_change_form(self):
+        self.assert_flat(self.pm, f'/tasks/task/{self.task.pk}/change/', self.change_form_budget)
+
+    def test_task_change_form_for_assignee(self):
+        self.assert_flat(self.devs[0], f'/tasks/task/{self.task.pk}/change/', self.change_form_budget)
+
+
+@override_settings(ADMIN_PAGINATION='keyset')
+@mock.patch.object(TaskAdmin, 'list_per_page', 3)
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        project = create_project(self.pm)
+        self.tasks = [create_task(project, self.pm, title=f'Task {i}') for i in range(8)]
+        # pairs of tasks created at the same moment are ordered by id
+        for i, task in enumerate(self.tasks):
+            Task.objects.filter(pk=task.pk).update(created_at=timezone.now() - timedelta(hours=i // 2))
+        self.expected = list(Task.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.client.force_login(self.pm)
+
+    def get_page(self, query=''):
+        response = self.client.get('/tasks/task/' + query)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_pages_forward_and_back(self):
+        pages = [self.get_page()]
+        while pages[-1].next_page_url:
+            pages.append(self.get_page(pages[-1].next_page_url))
+        self.assertEqual([[t.pk for t in page.result_list] for page in pages],
+                         [self.expected[:3], self.expected[3:6], self.expected[6:]])
+        self.assertEqual(pages[-1].result_count, 8)
+        self.assertIsNone(pages[0].previous_page_url)
+
+        previous = self.get_page(pages[-1].previous_page_url)
+        self.assertEqual([t.pk for t in previous.result_list], self.expected[3:6])
+        first = self.get_page(previous.previous_page_url)
+        self.assertEqual([t.pk for t in first.result_list], self.expected[:3])
+        self.assertIsNone(first.previous_page_url)
+
+    def test_filters_and_sorting(self):
+        cl = self.get_page(self.get_page().next_page_url)
+        self.assertNotIn(CURSOR_VAR, cl.get_query_string({'state__exact': 'to-do'}))
+        self.assertFalse(self.get_page('?o=1').keyset_pagination)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/tasks/task/?cursor=garbage')
+        self.assertRedirects(response, '/tasks/task/?e=1', fetch_redirect_response=False)
+
+
+class ReadApiTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.dev = create_employee('developer', chief=self.pm)
+        self.other = create_employee('analyst', role='analyst')
+        self.project = create_project(self.pm, employees=(self.dev,))
+        self.sprint = Sprint.objects.create(project=self.project, title='Sprint', date_start=date.today(),
+                                            date_end=date.today(), status='open', created_by=self.pm)
+        self.tasks = [create_task(self.project, self.dev, title=f'Task {i}', sprint=self.sprint) for i in range(5)]
+        self.tasks[0].sub_tasks.add(self.tasks[1], self.tasks[2])
+        create_task(create_project(self.other, short_name='XX'), self.other)
+        self.client.force_login(self.pm)
+
+    def get(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_tasks(self):
+        data = self.get('/api/tasks', fields='id,number,state,sub_tasks')
+        first = self.tasks[0]
+        self.assertEqual(data['results'][-1], {'id': first.pk, 'number': f'PM-{first.pk}', 'state': 'to-do',
+                                               'sub_tasks': [self.tasks[1].pk, self.tasks[2].pk]})
+        self.assertEqual(len(data['results']), 5)
+        self.assertIsNone(data['next_cursor'])
+
+        self.client.force_login(self.dev)
+        self.assertEqual(len(self.get('/api/tasks')['results']), 5)
+        self.client.force_login(self.other)
+        self.assertEqual(len(self.get('/api/tasks')['results']), 1)
+
+    def test_batch_and_pages(self):
+        pks = [task.pk for task in self.tasks]
+        data = self.get('/api/tasks', ids=f'{pks[3]},{pks[1]},999', fields='title')
+        self.assertEqual(data['results'], [{'title': 'Task 1'}, {'title': 'Task 3'}])
+
+        Task.objects.filter(pk__in=pks[:2]).update(created_at=timezone.now() - timedelta(days=1))
+        expected = list(Task.objects.filter(pk__in=pks).order_by('-created_at', '-pk').values_list('pk', flat=True))
+        seen, params = [], {'fields': 'id', 'limit': 2}
+        while True:
+            data = self.get('/api/tasks', **params)
+            seen += [row['id'] for row in data['results']]
+            if not data['next_cursor']:
+                break
+            params['cursor'] = data['next_cursor']
+        self.assertEqual(seen, expected)
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.get('/api/tasks')
+        with CaptureQueriesContext(connection) as few:
+            self.get('/api/tasks', ids=self.tasks[0].pk)
+        with CaptureQueriesContext(connection) as many:
+            self.get('/api/tasks')
+        self.assertEqual(len(few), len(many))
+
+    def test_sprints_and_projects(self):
+        sprint = self.get('/api/sprints', fields='id,project,tasks_total')['results']
+        self.assertEqual(sprint, [{'id': self.sprint.pk, 'project': self.project.pk, 'tasks_total': 5}])
+        projects = self.get('/api/projects', fields='short_name,employees')['results']
+        self.assertEqual(projects, [{'short_name': 'PM', 'employees': [self.dev.pk]}])
+
+        # as in the admin, only project managers see sprints and projects, and only their own
+        self.client.force_login(self.dev)
+        self.assertEqual(self.get('/api/sprints')['results'], [])
+        self.assertEqual(self.get('/api/projects')['results'], [])
+        self.client.force_login(create_employee('other', role='pm'))
+        self.assertEqual(self.get('/api/projects')['results'], [])
+
+    def test_errors(self):
+        for params in ({'fields': 'id,secret'}, {'ids': 'a'}, {'limit': 0}, {'cursor': 'garbage'}):
+            response = self.client.get('/api/tasks', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.json())
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/tasks').status_code, 401)
+
+
+@override_settings(CHANGE_FEED_DELAY=0, CHANGE_FEED_TOKEN='secret')
+class ChangeFeedTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.dev = create_employee('developer', chief=self.pm)
+        self.project = create_project(self.pm, employees=(self.dev,))
+        self.tasks = [create_task(self.project, self.dev, title=f'Task {i}') for i in range(3)]
+
+    def get(self, **params):
+        response = self.client.get('/api/changes', params, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_token(self):
+        # logged in users do not get the unfiltered feed
+        self.client.force_login(self.pm)
+        self.assertEqual(self.client.get('/api/changes').status_code, 403)
+        self.assertEqual(self.client.get('/api/changes', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with self.settings(CHANGE_FEED_TOKEN=''):
+            self.assertEqual(self.client.get('/api/changes', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    def test_changes_since_cursor(self):
+        feed = self.get()
+        self.assertEqual([(c['type'], c['id']) for c in feed['changes']],
+                         [('project', self.project.pk)] + [('task', task.pk) for task in self.tasks])
+        self.assertEqual(feed['changes'][1]['data']['title'], 'Task 0')
+        self.assertFalse(feed['more'])
+        self.assertEqual(self.get(since=feed['cursor'])['changes'], [])
+
+        self.tasks[1].title = 'Renamed'
+        self.tasks[1].save()
+        deleted = self.tasks[2].pk
+        self.tasks[2].delete()
+        changes = self.get(since=feed['cursor'])['changes']
+        self.assertEqual([(c['type'], c['id'], c['deleted']) for c in changes],
+                         [('task', self.tasks[1].pk, False), ('task', deleted, True)])
+        self.assertEqual(changes[0]['data']['title'], 'Renamed')
+
+        self.project.delete()
+        self.assertEqual(Tombstone.objects.filter(model='project').count(), 1)
+        self.assertEqual(len(self.get(since=feed['cursor'])['changes']), 4)
+
+    def test_link_changes(self):
+        cursor = self.get()['cursor']
+        self.tasks[0].sub_tasks.add(self.tasks[1])
+        changes = self.get(since=cursor)['changes']
+        self.assertEqual({c['id'] for c in changes}, {self.tasks[0].pk, self.tasks[1].pk})
+        self.assertEqual([c['data']['sub_tasks'] for c in changes if c['id'] == self.tasks[0].pk],
+                         [[self.tasks[1].pk]])
+
+        cursor = self.get(since=cursor)['cursor']
+        self.tasks[1].parent_task.clear()
+        self.assertEqual({c['id'] for c in self.get(since=cursor)['changes']}, {self.tasks[0].pk, self.tasks[1].pk})
+
+        cursor = self.get(since=cursor)['cursor']
+        self.dev.employee_projects.clear()
+        changes = self.get(since=cursor)['changes']
+        self.assertEqual([(c['type'], c['data']['employees']) for c in changes], [('project', [])])
+
+    def test_pages_and_delay(self):
+        seen, params = [], {'limit': 2}
+        while True:
+            feed = self.get(**params)
+            seen += [c['id'] for c in feed['changes']]
+            params['since'] = feed['cursor']
+            if not feed['more']:
+                break
+        self.assertEqual(seen, [self.project.pk] + [task.pk for task in self.tasks])
+
+        with self.settings(CHANGE_FEED_DELAY=60):
+            self.tasks[0].save()
+            self.assertEqual(self.get(since=feed['cursor'])['changes'], [])
+        self.assertEqual(self.get(since=feed['cursor'])['changes'][0]['id'], self.tasks[0].pk)
+        response = self.client.get('/api/changes', {'since': 'garbage'}, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 400)
+
+    def test_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('changes', stdout=out, stderr=err)
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([line['type'] for line in lines], ['project', 'task', 'task', 'task'])
+        cursor = err.getvalue().split()[-1]
+
+        deleted = self.tasks[0].pk
+        self.tasks[0].delete()
+        out = StringIO()
+        call_command('changes', since=cursor, stdout=out, stderr=StringIO())
+        self.assertEqual(json.loads(out.getvalue()), {'type': 'task', 'id': deleted, 'deleted': True})
+
+
+class TaskSearchTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.project = create_project(self.pm)
+        self.deploy = create_task(self.project, self.pm, title='Deployment pipeline',
+                                  description='Deployment to staging and deployment to production')
+        self.review = create_task(self.project, self.pm, title='Code review', accept_criterion='Approved deployment')
+        self.other = create_task(self.project, self.pm, title='Write documentation')
+
+    def search(self, term):
+        return list(search_tasks(Task.objects.all(), term).order_by('-search_rank').values_list('pk', flat=True))
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(self.search('deplo'), [self.deploy.pk, self.review.pk])
+        self.assertEqual(self.search('APPROVED deploy'), [self.review.pk])
+        self.assertEqual(self.search('staging missing'), [])
+        self.assertEqual(self.search(f'PM-{self.other.pk}'), [self.other.pk])
+
+    def test_numbers_and_other_fields(self):
+        budget = create_task(self.project, create_employee('petrov'), title='Migrate 2021 budget')
+        self.assertEqual(self.search('petrov'), [budget.pk])
+        self.assertEqual(self.search('2021'), [budget.pk])
+        self.assertEqual(self.search(f'pm-{self.other.pk}'), [self.other.pk])
+        self.assertEqual(self.search(f'XX-{self.other.pk}'), [])
+        self.assertEqual(self.search(f'{self.other.pk}')[0], self.other.pk)
+
+    def test_index_follows_changes(self):
+        self.other.description = 'Deployment guide'
+        self.other.save()
+        self.deploy.delete()
+        self.assertEqual(set(self.search('deployment')), {self.review.pk, self.other.pk})
+        self.assertEqual(self.search('documentation'), [self.other.pk])
+
+    def test_changelist(self):
+        self.client.force_login(self.pm)
+        response = self.client.get('/tasks/task/?q=deplo')
+        self.assertEqual([t.pk for t in response.context['cl'].result_list], [self.deploy.pk, self.review.pk])
+
+
+class TaskTransferTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.dev = create_employee('developer', chief=self.pm)
+        self.project = create_project(self.pm, employees=[self.dev])
+        self.tasks = [create_task(self.project, self.dev, title=f'Task {i}') for i in range(3)]
+        self.tasks[0].sub_tasks.add(self.tasks[1], self.tasks[2])
+        Item.objects.create(task=self.tasks[1], item_description='Check', is_done=True)
+
+    def export(self, format):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f'tasks.{format}')
+            call_command('export_tasks', output=path, project=[self.project.pk])
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+
+    def import_(self, content, format):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f'tasks.{format}')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            out, err = StringIO(), StringIO()
+            call_command('import_tasks', path, batch_size=2, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def assert_copied(self):
+        copies = Task.objects.exclude(pk__in=[t.pk for t in self.tasks])
+        self.assertEqual(sorted(copies.values_list('title', flat=True)), ['Task 0', 'Task 1', 'Task 2'])
+        parent = copies.get(title='Task 0')
+        self.assertEqual(sorted(parent.sub_tasks.values_list('title', flat=True)), ['Task 1', 'Task 2'])
+        self.assertEqual(list(Item.objects.filter(task__in=copies).values_list('task__title', 'is_done')),
+                         [('Task 1', True)])
+
+    def test_jsonl_round_trip(self):
+        out, err = self.import_(self.export('jsonl'), 'jsonl')
+        self.assertIn('Imported 3 tasks, 1 items, 2 sub_task links, skipped 0 records', out)
+        self.assert_copied()
+
+    def test_csv_round_trip(self):
+        self.import_(self.export('csv'), 'csv')
+        self.assert_copied()
+
+    def test_export_to_stdout(self):
+        out = StringIO()
+        call_command('export_tasks', project=[self.project.pk], stdout=out)
+        self.assertEqual(out.getvalue(), self.export('jsonl'))
+
+    def test_invalid_records_are_skipped(self):
+        valid = json.loads(self.export('jsonl').splitlines()[0])
+        records = [
+            dict(valid, deadline=valid['redline'], redline=valid['deadline']),
+            dict(valid, project=0),
+            dict(valid, id=None, title='Imported'),
+            {'type': 'item', 'task': valid['id'], 'item_description': 'Orphan'},
+        ]
+        out, err = self.import_('\n'.join(map(json.dumps, records)) + '\nnot json\n', 'jsonl')
+        self.assertIn('Imported 1 tasks, 0 items', out)
+        self.assertIn('line 1: Deadline must be greater', err)
+        self.assertIn('line 2: Unknown project 0', err)
+        self.assertIn(f"line 4: Task {valid['id']} is not part of the import", err)
+        self.assertIn('line 5: Malformed record', err)
+
+    def test_admin_export_and_import(self):
+        self.client.force_login(self.pm)
+        response = self.client.post('/tasks/task/', {'action': 'export_jsonl', '_selected_action': [self.tasks[0].pk]})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['Task 0'])
+
+        upload = SimpleUploadedFile('tasks.jsonl', b'\n'.join(line.encode() for line in lines))
+        response = self.client.post('/tasks/task/import/', {'file': upload})
+        self.assertRedirects(response, '/tasks/task/', fetch_redirect_response=False)
+        copy = Task.objects.exclude(pk__in=[t.pk for t in self.tasks]).get()
+        self.assertEqual((copy.title, copy.created_by), ('Task 0', self.pm))
+
+
+class TaskReportTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.devs = [create_employee(f'developer{i}', chief=self.pm) for i in range(2)]
+        self.project = create_project(self.pm, employees=self.devs)
+        self.sprint = Sprint.objects.create(project=self.project, title='Sprint 1', status='open', created_by=self.pm,
+                                            date_start=date.today(), date_end=date.today() + timedelta(days=14))
+        self.client.force_login(self.pm)
+
+    def report(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/tasks/task/report.csv' + query)
+            rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        return rows, len(queries)
+
+    def test_filtered_report(self):
+        task = create_task(self.project, self.devs[0], title='Mine', sprint=self.sprint)
+        create_task(self.project, self.devs[1], title='Other')
+        self.report()  # warms up the content types cache
+        rows, queries = self.report(f'?employee__id__exact={self.devs[0].pk}')
+        self.assertEqual(rows[0][:5], ['Number', 'Title', 'Project', 'Sprint', 'Assigned'])
+        self.assertEqual(rows[1][:7], [f'PM-{task.pk}', 'Mine', 'PM', '(PM) Sprint 1', 'Developer0', 'Not started',
+                                       'Low'])
+        self.assertEqual(len(rows), 2)
+
+        for i in range(20):
+            create_task(self.project, self.devs[i % 2], title=f'Task {i}', sprint=self.sprint)
+        rows, more_queries = self.report(f'?employee__id__exact={self.devs[0].pk}')
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(more_queries, queries)
+
+    def test_changelist_links_report(self):
+        response = self.client.get('/tasks/task/?state__exact=done')
+        self.assertContains(response, '/tasks/task/report.csv?state__exact=done')
+
+
+class TaskBulkActionTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.lead = create_employee('devlead', chief=self.pm, role='lead_dev')
+        self.dev = create_employee('developer', chief=self.lead)
+        self.outsider = create_employee('outsider', chief=self.lead)
+        self.project = create_project(self.pm, employees=[self.lead, self.dev])
+        self.other_project = create_project(self.pm, short_name='OT', employees=[self.lead])
+        self.tasks = [create_task(self.project, self.dev, title=f'Task {i}') for i in range(3)]
+        self.own_task = create_task(self.project, self.lead, title='Own')
+        Task.objects.update(last_modified=timezone.now() - timedelta(days=1))
+
+    def run_action(self, user, action, tasks, **values):
+        self.client.force_login(user)
+        data = dict(action=action, _selected_action=[t.pk for t in tasks], **values)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/tasks/task/', data, follow=True)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "tasks_task"')]
+        return [str(m) for m in response.context['messages']], updates
+
+    def test_set_state(self):
+        messages, updates = self.run_action(self.lead, 'set_state', self.tasks + [self.own_task], state='done')
+        self.assertEqual(messages, ['Updated 4 tasks'])
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(set(Task.objects.values_list('state', flat=True)), {'done'})
+        self.assertEqual(Task.objects.filter(last_modified__lt=timezone.now() - timedelta(hours=1)).count(), 0)
+
+    def test_assign_employee(self):
+        messages, updates = self.run_action(self.pm, 'assign_employee', self.tasks, employee=self.outsider.pk)
+        self.assertEqual(messages, ["The employee is not a member of every selected task's project"])
+        self.assertEqual(updates, [])
+
+        messages, updates = self.run_action(self.pm, 'assign_employee', self.tasks[:2], employee=self.lead.pk)
+        self.assertEqual(messages, ['Updated 2 tasks'])
+        self.assertEqual(Task.objects.filter(employee=self.lead).count(), 3)
+
+    def test_move_to_sprint(self):
+        sprint = Sprint.objects.create(project=self.other_project, title='Other', status='open', created_by=self.pm,
+                                       date_start=date.today(), date_end=date.today() + timedelta(days=14))
+        messages, updates = self.run_action(self.pm, 'move_to_sprint', self.tasks, sprint=sprint.pk)
+        self.assertEqual(messages, ["Every selected task has to belong to the sprint's project"])
+
+        sprint.project = self.project
+        sprint.save()
+        messages, updates = self.run_action(self.pm, 'move_to_sprint', self.tasks, sprint=sprint.pk)
+        self.assertEqual(messages, ['Updated 3 tasks'])
+        self.assertEqual(Task.objects.filter(sprint=sprint).count(), 3)
+
+    def test_action_form_choices(self):
+        self.client.force_login(self.lead)
+        form = self.client.get('/tasks/task/').context['action_form']
+        self.assertEqual([name for pk, name in form.fields['employee'].widget.choices],
+                         ['---------', 'Developer', 'Outsider'])
+
+    def test_assignee_cannot_change_own_tasks(self):
+        messages, updates = self.run_action(self.lead, 'set_priority', [self.own_task], priority='high')
+        self.assertEqual(messages, ['Tasks assigned to you can only change their status'])
+        self.assertEqual(updates, [])
+
+
+class RollupTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.dev = create_employee('developer', chief=self.pm)
+        self.project = create_project(self.pm, employees=[self.dev])
+        self.sprints = [Sprint.objects.create(project=self.project, title=f'Sprint {i}', status='open',
+                                              created_by=self.pm, date_start=date.today(),
+                                              date_end=date.today() + timedelta(days=14)) for i in range(2)]
+        self.task = create_task(self.project, self.dev, sprint=self.sprints[0])
+        self.items = [Item.objects.create(task=self.task, item_description=f'Item {i}') for i in range(3)]
+        create_task(self.project, self.dev, state='done', sprint=self.sprints[1])
+
+    def counters(self, obj):
+        obj.refresh_from_db()
+        return {field: getattr(obj, field) for field in ROLLUP_FIELDS if getattr(obj, field)}
+
+    def assert_consistent(self):
+        # the incremental updates agree with a full recount
+        self.assertEqual(reconcile_rollups(), {'sprint': 0, 'project': 0})
+
+    def test_incremental_updates(self):
+        self.assertEqual(self.counters(self.sprints[0]), {'tasks_total': 1, 'items_total': 3})
+        self.assertEqual(self.counters(self.project), {'tasks_total': 2, 'tasks_done': 1, 'items_total': 3})
+
+        item = Item.objects.get(pk=self.items[0].pk)
+        item.is_done = True
+        item.save()
+        task = Task.objects.get(pk=self.task.pk)
+        task.state = 'late'
+        task.sprint = self.sprints[1]
+        task.save()
+        self.assertEqual(self.counters(self.sprints[0]), {})
+        self.assertEqual(self.counters(self.sprints[1]),
+                         {'tasks_total': 2, 'tasks_done': 1, 'tasks_late': 1, 'items_total': 3, 'items_done': 1})
+        self.assert_consistent()
+
+        self.items[1].delete()
+        task.delete()
+        self.assertEqual(self.counters(self.project), {'tasks_total': 1, 'tasks_done': 1})
+        self.assert_consistent()
+
+    @override_settings(OVERDUE_STATUS_MODE='persisted')
+    def test_bulk_updates(self):
+        self.client.force_login(self.pm)
+        self.client.post('/tasks/task/', {'action': 'move_to_sprint', '_selected_action': [self.task.pk],
+                                          'sprint': self.sprints[1].pk})
+        self.client.post('/tasks/task/', {'action': 'set_state', '_selected_action': [self.task.pk], 'state': 'done'})
+        self.assertEqual(self.counters(self.sprints[1]), {'tasks_total': 2, 'tasks_done': 2, 'items_total': 3})
+        Task.objects.filter(pk=self.task.pk).update(state='to-do', redline=timezone.now() - timedelta(hours=1))
+        sweep_overdue()
+        self.assertEqual(self.counters(self.sprints[1])['tasks_delay'], 1)
+        self.assert_consistent()
+
+    def test_reconcile(self):
+        Sprint.objects.filter(pk=self.sprints[0].pk).update(tasks_total=10, items_done=2)
+        out = StringIO()
+        call_command('reconcile_rollups', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Corrected 1 sprints, 0 projects')
+        self.assertEqual(self.counters(self.sprints[0]), {'tasks_total': 1, 'items_total': 3})
+
+
+class TaskGraphTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.project = create_project(self.pm)
+        now = timezone.now().replace(microsecond=0)
+        # epic -> (design -> build, review)
+        self.epic = create_task(self.project, self.pm, title='Epic', redline=now + timedelta(days=5),
+                                deadline=now + timedelta(days=10))
+        self.design = create_task(self.project, self.pm, title='Design', redline=now + timedelta(days=2),
+                                  deadline=now + timedelta(days=20))
+        self.build = create_task(self.project, self.pm, title='Build', redline=now + timedelta(days=8),
+                                 deadline=now + timedelta(days=9))
+        self.review = create_task(self.project, self.pm, title='Review', redline=now + timedelta(days=1),
+                                  deadline=now + timedelta(days=3))
+        self.epic.sub_tasks.add(self.design, self.review)
+        self.design.sub_tasks.add(self.build)
+
+    def test_lookups(self):
+        with self.assertNumQueries(1):
+            graph = TaskGraph.for_project(self.project.pk)
+        self.assertEqual(graph.descendants(self.epic.pk), {self.design.pk, self.build.pk, self.review.pk})
+        self.assertEqual(graph.ancestors(self.build.pk), {self.epic.pk, self.design.pk})
+        order = graph.topological_order()
+        self.assertLess(order.index(self.epic.pk), order.index(self.design.pk))
+        self.assertLess(order.index(self.design.pk), order.index(self.build.pk))
+
+    def test_deadlines_and_critical_path(self):
+        graph = TaskGraph.for_project(self.project.pk)
+        deadlines = graph.effective_deadlines()
+        self.assertEqual(deadlines[self.design.pk], self.epic.deadline)
+        self.assertEqual(deadlines[self.build.pk], self.build.deadline)
+        self.assertEqual(graph.expected_completions()[self.epic.pk], self.build.redline)
+        self.assertEqual(graph.critical_path(self.epic.pk), [self.epic.pk, self.design.pk, self.build.pk])
+
+    def test_cycles_are_rejected(self):
+        with self.assertRaises(TaskCycleError), transaction.atomic():
+            self.build.sub_tasks.add(self.epic)
+        with self.assertRaises(TaskCycleError), transaction.atomic():
+            self.epic.parent_task.add(self.build)
+        self.assertFalse(self.build.sub_tasks.exists())
+
+        data = {'project': self.project.pk, 'title': 'Build', 'employee': self.pm.pk, 'created_by': self.pm.pk,
+                'state': 'to-do', 'priority': 'low', 'sub_tasks': [self.epic.pk],
+                'redline': timezone.localtime(self.build.redline).strftime('%Y-%m-%d %H:%M:%S'),
+                'deadline': timezone.localtime(self.build.deadline).strftime('%Y-%m-%d %H:%M:%S')}
+        form = TaskForm(data, instance=Task.objects.get(pk=self.build.pk))
+        self.assertFalse(form.is_valid())
+        self.assertIn('sub_tasks', form.errors)
+        # a task of another branch is fine
+        form = TaskForm(dict(data, sub_tasks=[self.review.pk]), instance=self.build)
+        self.assertTrue(form.is_valid(), form.errors)
+
+
+@modify_settings(MIDDLEWARE={'prepend': 'pm.metrics.QueryMetricsMiddleware'})
+class QueryMetricsTest(TestCase):
+    def setUp(self):
+        self.pm = create_employee('manager', role='pm')
+        self.client.force_login(self.pm)
+
+    def test_request_is_logged_and_exported(self):
+        with self.assertLogs('pm.metrics', 'INFO') as logs:
+            self.client.get('/tasks/task/')
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['view'], 'admin:tasks_task_changelist')
+        self.assertGreater(line['queries'], 0)
+        self.assertLessEqual(len(line['slowest']), 5)
+
+        metrics = metrics_view(None).content.decode()
+        self.assertIn('pm_db_queries_total{view="admin:tasks_task_changelist",method="GET"}', metrics)
+        self.assertIn('pm_request_duration_seconds_bucket{view="admin:tasks_task_changelist",method="GET",le="+Inf"}',
+                      metrics)
+
+
+class ConnectionPoolTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_dict = dict(connection.settings_dict, ENGINE='pm.db.backends.sqlite3',
+                                  NAME=os.path.join(directory.name, 'pool.sqlite3'),
+                                  POOL={'MAX_SIZE': 1, 'TIMEOUT': 0.1, 'MAX_IDLE': 300})
+
+    def wrapper(self):
+        wrapper = PooledSQLiteWrapper(self.settings_dict, alias='pooled')
+        self.addCleanup(wrapper.pool.close_idle)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_connection_is_reused(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        raw = first.connection
+        first.close()
+        self.assertEqual(first.pool.stats(), {'size': 1, 'idle': 1, 'max_size': 1})
+
+        second = self.wrapper()
+        second.ensure_connection()
+        self.assertIs(second.connection, raw)
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+        metrics = metrics_view(None).content.decode()
+        self.assertIn('pm_db_pool_checkouts_total{alias="pooled"}', metrics)
+        self.assertIn('pm_db_pool_connections{alias="pooled"} 1', metrics)
+
+    def test_broken_connection_is_replaced(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        raw = first.connection
+        first.close()
+        # closed behind the pool's back, like a connection the server dropped
+        raw.close()
+
+        second = self.wrapper()
+        second.ensure_connection()
+        self.assertIsNot(second.connection, raw)
+        self.assertEqual(second.pool.stats()['size'], 1)
+
+    def test_timeout(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        second = self.wrapper()
+        with self.assertRaises(PoolTimeout):
+            second.ensure_connection()
+        first.close()
+        second.ensure_connection()
+
+
+    def test_expired_connections_are_closed(self):
+        pool = ConnectionPool('expiry', max_size=3, timeout=0.1, max_idle=300)
+        clock = mock.patch('pm.db.pool.monotonic', return_value=1000.0)
+        now = clock.start()
+        self.addCleanup(clock.stop)
+        first, second, third = [pool.acquire(mock.Mock) for i in range(3)]
+        pool.release(first)
+        now.return_value = 1200.0
+        pool.release(second)
+        pool.release(third)
+        # the oldest idle connection expires even though checkouts never reach it
+        now.return_value = 1400.0
+        self.assertIs(pool.acquire(mock.Mock), third)
+        first.close.assert_called_once_with()
+        self.assertEqual(pool.stats(), {'size': 2, 'idle': 1, 'max_size': 3})
+
+    def test_close_pools(self):
+        pool = get_pool('pooled', self.settings_dict)
+        connection = pool.acquire(mock.Mock)
+        pool.release(connection)
+        close_pools()
+        connection.close.assert_called_once_with()
+        self.assertEqual(pool.stats()['idle'], 0)
+
+
+class SyntheticDataTest(TestCase):
+    def test_generate_and_bench(self):
+        call_command('generate_data', depth=3, fanout=2, projects=2, sprints=2, tasks=20, stdout=StringIO())
+        self.assertEqual(Employee.objects.count(), 15)
+        self.assertEqual(Task.objects.count(), 40)
+        root = Employee.objects.get(role='pm')
+        self.assertEqual(get_employee_subordinates(root).count(), 14)
+        self.assertEqual(Employee.objects.create(username='new', name='New').pk, 16)
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench', repeat=1, output=output, stdout=StringIO())
+            with open(output) as f:
+                report = json.load(f)
+        self.assertEqual(report['dataset']['Task'], 40)
+        self.assertEqual(report['results']['api options (warm)']['queries'], 2)
+
+
+class IndexUsageTest(TestCase):
+    # A full scan of one of these tables means a sweep or changelist query lost its index.
+    TABLE_SCAN = re.compile(r'(SCAN (TABLE )?|Seq Scan on )"?(tasks_task|tasks_sprint|tasks_project)"?\b(?! USING)')
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_data', depth=3, fanout=3, projects=40, sprints=4, tasks=25, stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndexes(self, queryset):
+        plan = queryset.explain()
+        self.assertIsNone(self.TABLE_SCAN.search(plan), plan)
+
+    def test_overdue_sweep(self):
+        now, today = timezone.now(), timezone.localdate()
+        self.assertUsesIndexes(Task.objects.filter(state__in=OPEN_TASK_STATES, redline__lte=now).values('pk'))
+        self.assertUsesIndexes(Task.objects.filter(state__in=OPEN_TASK_STATES + ('delay',), deadline__lte=now))
+        for model in (Sprint, Project):
+            self.assertUsesIndexes(model.objects.filter(status__in=OPEN_STATUSES, redline__lt=today).values('pk'))
+            self.assertUsesIndexes(model.objects.filter(status__in=OPEN_STATUSES + ('delay',), date_end__lt=today))
+
+    def test_changelists(self):
+        root = Employee.objects.get(role='pm')
+        dev = Employee.objects.filter(role='dev').first()
+        self.assertUsesIndexes(Task.objects.visible_to(dev).order_by('-created_at', '-id')[:100])
+        self.assertUsesIndexes(Task.objects.visible_to(dev).filter(state='to-do'))
+        self.assertUsesIndexes(Task.objects.filter(project__created_by=root, sprint__isnull=False))
+        for model in (Sprint, Project):
+            self.assertUsesIndexes(model.objects.filter(created_by=root).order_by('-created_at', '-id')[:100])
+
+    def test_change_feed(self):
+        since = timezone.now() - timedelta(minutes=1)
+        for model in (Task, Sprint, Project):
+            self.assertUsesIndexes(model.objects.filter(last_modified__gt=since).order_by('last_modified', 'pk')[:100])
+
+    def test_search(self):
+        dev = Employee.objects.filter(role='dev').first()
+        task = Task.objects.select_related('project').first()
+        for term in ('synthetic tas', task.number):
+            queryset = search_tasks(Task.objects.visible_to(dev).filter(state='to-do'), term)
+            self.assertUsesIndexes(queryset)
+            self.assertRegex(queryset.explain(), r'task_search_idx|tasks_task_fts VIRTUAL TABLE INDEX \d+:M')
+
+
+class AsgiTest(SimpleTestCase):
+    def call(self, application, path):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'http_version': '1.1', 'method': 'GET', 'path': path, 'query_string': b'',
+                 'headers': [(b'host', b'testserver')]}
+        return application(scope, receive, send), messages
+
+    def test_request(self):
+        from pm.asgi import application
+        request, messages = self.call(application, '/api/tasks')
+
+        async def run():
+            await request
+
+        async_to_sync(run)()
+        self.assertEqual(messages[0]['status'], 401)
+        self.assertEqual(json.loads(b''.join(m.get('body', b'') for m in messages[1:])),
+                         {'error': "Authentication required"})
+
+    def test_requests_run_in_parallel_threads(self):
+        from pm.asgi import application
+        # both requests have to be inside the WSGI app at the same time to pass the barrier
+        barrier, threads = threading.Barrier(2, timeout=5), set()
+
+        def wsgi_application(environ, start_response):
+            threads.add(threading.current_thread().name)
+            barrier.wait()
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'ok']
+
+        async def run():
+            calls = [self.call(type(application)(wsgi_application), '/') for i in range(2)]
+            await asyncio.gather(*[request for request, messages in calls])
+            return [message for request, messages in calls for message in messages]
+
+        messages = async_to_sync(run)()
+        self.assertEqual([m['status'] for m in messages if 'status' in m], [200, 200])
+        self.assertEqual(len(threads), 2)
+
+
+class LoadTestCommandTest(LiveServerTestCase):
+    def test_loadtest(self):
+        pm = create_employee('manager', role='pm')
+        project = create_project(pm)
+        out = StringIO()
+        call_command('loadtest', f'{self.live_server_url}/api/options?id={project.pk}', requests=8, concurrency=2,
+                     user='manager', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], '8 requests, 2 concurrent, 0 errors')
+        self.assertRegex(lines[1], r'^[\d.]+ requests/s  p50 [\d.]+ ms  p99 [\d.]+ ms$')
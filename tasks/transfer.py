@@ -0,0 +1,296 @@
+import csv
+import json
+
+from django.db import connections, transaction
+from django.db.models import Max
+from django.forms import ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from tasks.cache import bump_versions, project_scope
+from tasks.forms import validate_dates
+from tasks.graph import TaskCycleError, TaskGraph
+from tasks.lib import get_employee_projects, get_subordinate_ids
+from tasks.models import Employee, Item, Project, Sprint, Task
+from tasks.rollups import recompute_rollups
+
+FORMATS = ('jsonl', 'csv')
+
+# record field -> Task column
+TASK_COLUMNS = {
+    'id': 'id',
+    'project': 'project_id',
+    'sprint': 'sprint_id',
+    'title': 'title',
+    'description': 'description',
+    'accept_criterion': 'accept_criterion',
+    'redline': 'redline',
+    'deadline': 'deadline',
+    'employee': 'employee_id',
+    'state': 'state',
+    'priority': 'priority',
+    'created_by': 'created_by_id',
+    'created_at': 'created_at',
+}
+ITEM_FIELDS = ('task', 'item_description', 'is_done')
+SUB_TASK_FIELDS = ('task', 'sub_task')
+CSV_FIELDS = ('type',) + tuple(TASK_COLUMNS) + ('task', 'item_description', 'is_done', 'sub_task')
+
+EXPORT_CHUNK_SIZE = 2000
+
+SubTask = Task.sub_tasks.through
+
+
+def export_records(tasks):
+    """
+    Task records followed by the checklist items and sub_task links between the exported tasks.
+    Every query streams through iterator(), so memory use does not depend on the number of tasks.
+    """
+    ids = tasks.values('pk')
+    for row in tasks.order_by('pk').values_list(*TASK_COLUMNS.values()).iterator(EXPORT_CHUNK_SIZE):
+        yield dict(type='task', **dict(zip(TASK_COLUMNS, map(serialize, row))))
+    items = Item.objects.filter(task__in=ids).order_by('pk').values_list('task_id', 'item_description', 'is_done')
+    for row in items.iterator(EXPORT_CHUNK_SIZE):
+        yield dict(type='item', **dict(zip(ITEM_FIELDS, row)))
+    links = SubTask.objects.filter(from_task__in=ids, to_task__in=ids).order_by('pk')
+    for row in links.values_list('from_task_id', 'to_task_id').iterator(EXPORT_CHUNK_SIZE):
+        yield dict(type='sub_task', **dict(zip(SUB_TASK_FIELDS, row)))
+
+
+def serialize(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def jsonl_lines(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def csv_lines(records):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for record in records:
+        yield writer.writerow(['' if record.get(field) is None else record[field] for field in CSV_FIELDS])
+
+
+def export_lines(records, format):
+    return csv_lines(records) if format == 'csv' else jsonl_lines(records)
+
+
+def read_records(lines, format):
+    # (line number, record) pairs; a record that cannot be parsed is None
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, {key: value if value != '' else None for key, value in record.items()}
+        return
+    for number, line in enumerate(lines, 1):
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield number, record if isinstance(record, dict) else None
+
+
+def parse_id(record, field, required=True):
+    value = record.get(field)
+    if value is None:
+        if required:
+            raise ValidationError(f"`{field}` is required")
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"`{field}` must be an id, got {value!r}")
+
+
+def parse_moment(record, field):
+    value = record.get(field)
+    moment = parse_datetime(value) if isinstance(value, str) else None
+    if moment is None:
+        raise ValidationError(f"`{field}` must be an ISO 8601 date and time, got {value!r}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_text(record, field, max_length, required=False):
+    value = record.get(field)
+    if value is None or value == '':
+        if required:
+            raise ValidationError(f"`{field}` is required")
+        return None
+    value = str(value)
+    if len(value) > max_length:
+        raise ValidationError(f"`{field}` is longer than {max_length} characters")
+    return value
+
+
+def parse_choice(record, field, choices, default):
+    value = record.get(field) or default
+    if value not in dict(choices):
+        raise ValidationError(f"`{field}` must be one of {', '.join(dict(choices))}, got {value!r}")
+    return value
+
+
+def parse_flag(value):
+    return value in (True, 1, '1', 'true', 'True')
+
+
+class TaskImporter:
+    """
+    Imports the records written by export_records. Tasks get new ids; items and sub_task links refer to the
+    exported task ids, so they have to follow their tasks in the stream. Records are checked like TaskForm,
+    written with bulk_create and committed in batches of `batch_size`. Invalid records are skipped and
+    reported in `errors` with their line numbers.
+
+    With a `user` the import is limited to the user's projects and subordinates, as in TaskAdmin, and the
+    tasks are created by that user.
+    """
+
+    def __init__(self, batch_size=500, user=None, using='default'):
+        self.batch_size = batch_size
+        self.user = user
+        self.using = using
+        self.tasks, self.items, self.links = [], [], []
+        # exported task id -> imported Task
+        self.imported = {}
+        self.projects, self.sprints = set(), set()
+        # links between the imported tasks, which are new and have no others
+        self.graph = TaskGraph()
+        self.errors = []
+        self.counts = {'task': 0, 'item': 0, 'sub_task': 0}
+
+    def run(self, records):
+        for line, record in records:
+            try:
+                self.add(line, record)
+            except ValidationError as e:
+                self.errors.append((line, '; '.join(e.messages)))
+            if len(self.tasks) + len(self.items) + len(self.links) >= self.batch_size:
+                self.flush()
+        self.flush()
+        # bulk_create sends no signals, so the cached options of the touched projects are dropped and their
+        # progress rollups recounted here
+        bump_versions(*map(project_scope, self.projects))
+        recompute_rollups(self.sprints, self.projects, using=self.using)
+        return self.counts
+
+    def add(self, line, record):
+        if record is None:
+            raise ValidationError("Malformed record")
+        kind = record.get('type')
+        if kind == 'task':
+            self.tasks.append((line, record.get('id'), self.parse_task(record)))
+        elif kind == 'item':
+            self.items.append((line, parse_id(record, 'task'), Item(
+                item_description=parse_text(record, 'item_description', 200, required=True),
+                is_done=parse_flag(record.get('is_done')))))
+        elif kind == 'sub_task':
+            self.links.append((line, parse_id(record, 'task'), parse_id(record, 'sub_task')))
+        else:
+            raise ValidationError(f"Unknown record type {kind!r}")
+
+    def parse_task(self, record):
+        task = Task(
+            project_id=parse_id(record, 'project'),
+            sprint_id=parse_id(record, 'sprint', required=False),
+            title=parse_text(record, 'title', 200, required=True),
+            description=parse_text(record, 'description', 2000),
+            accept_criterion=parse_text(record, 'accept_criterion', 2000),
+            redline=parse_moment(record, 'redline'),
+            deadline=parse_moment(record, 'deadline'),
+            employee_id=parse_id(record, 'employee'),
+            state=parse_choice(record, 'state', Task.STATUSES, 'to-do'),
+            priority=parse_choice(record, 'priority', Task.PRIORITIES, Task.PRIORITIES[0][0]),
+            created_by_id=self.user.pk if self.user else parse_id(record, 'created_by', required=False),
+        )
+        validate_dates(task.redline, task.deadline)
+        return task
+
+    def flush(self):
+        tasks = self.check_references(self.tasks)
+        with transaction.atomic(using=self.using):
+            self.save_tasks([task for line, source_id, task in tasks])
+            for line, source_id, task in tasks:
+                if source_id is not None:
+                    self.imported[str(source_id)] = task
+
+            items = []
+            for line, task_id, item in self.items:
+                task = self.find_task(line, task_id)
+                if task:
+                    item.task_id = task.pk
+                    items.append(item)
+            Item.objects.using(self.using).bulk_create(items)
+
+            links = []
+            for line, task_id, sub_task_id in self.links:
+                task, sub_task = self.find_task(line, task_id), self.find_task(line, sub_task_id)
+                if task and sub_task:
+                    try:
+                        self.graph.check_edge(task.pk, sub_task.pk)
+                    except TaskCycleError as e:
+                        self.errors.append((line, str(e)))
+                        continue
+                    self.graph.add_edge(task.pk, sub_task.pk)
+                    links.append(SubTask(from_task_id=task.pk, to_task_id=sub_task.pk))
+            SubTask.objects.using(self.using).bulk_create(links)
+
+        self.counts['task'] += len(tasks)
+        self.counts['item'] += len(items)
+        self.counts['sub_task'] += len(links)
+        self.tasks, self.items, self.links = [], [], []
+
+    def find_task(self, line, task_id):
+        task = self.imported.get(str(task_id))
+        if task is None:
+            self.errors.append((line, f"Task {task_id} is not part of the import"))
+        return task
+
+    def check_references(self, tasks):
+        # One query per referenced model for the whole batch.
+        project_ids = {task.project_id for line, source_id, task in tasks}
+        sprint_ids = {task.sprint_id for line, source_id, task in tasks} - {None}
+        employee_ids = {task.employee_id for line, source_id, task in tasks}
+        creator_ids = {task.created_by_id for line, source_id, task in tasks} - {None}
+
+        projects = get_employee_projects(self.user) if self.user else Project.objects.all()
+        projects = set(projects.using(self.using).filter(pk__in=project_ids).values_list('pk', flat=True))
+        sprints = dict(Sprint.objects.using(self.using).filter(pk__in=sprint_ids).values_list('pk', 'project_id'))
+        employees = set(Employee.objects.using(self.using).filter(pk__in=employee_ids | creator_ids)
+                        .values_list('pk', flat=True))
+        if self.user:
+            employees &= get_subordinate_ids(self.user, include_self=True)
+
+        valid = []
+        for line, source_id, task in tasks:
+            if task.project_id not in projects:
+                self.errors.append((line, f"Unknown project {task.project_id}"))
+            elif task.sprint_id is not None and sprints.get(task.sprint_id) != task.project_id:
+                self.errors.append((line, f"Sprint {task.sprint_id} does not belong to project {task.project_id}"))
+            elif task.employee_id not in employees:
+                self.errors.append((line, f"Unknown employee {task.employee_id}"))
+            else:
+                if task.created_by_id not in employees:
+                    task.created_by_id = None
+                valid.append((line, source_id, task))
+                self.projects.add(task.project_id)
+                self.sprints.add(task.sprint_id)
+        return valid
+
+    def save_tasks(self, tasks):
+        connection = connections[self.using]
+        if not connection.features.can_return_ids_from_bulk_insert:
+            # The ids are needed for the items and links. They are taken after the current maximum inside the
+            # batch transaction, as generate_data does; a concurrent insert makes the batch fail, never mixes ids.
+            start = (Task.objects.using(self.using).aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+            for pk, task in enumerate(tasks, start):
+                task.pk = pk
+        Task.objects.using(self.using).bulk_create(tasks)
@@ -5,5 +5,9 @@ from tasks import views
 app_name='tasks'
 
 urlpatterns = [
-    url(r'^options$', views.get_options)
+    url(r'^options$', views.get_options),
+    url(r'^tasks$', views.get_tasks, name='tasks'),
+    url(r'^sprints$', views.get_sprints, name='sprints'),
+    url(r'^projects$', views.get_projects, name='projects'),
+    url(r'^changes$', views.get_changes, name='changes'),
 ]
@@ -1,22 +1,75 @@
 import json
 
-from django.http import HttpResponse
-from tasks.lib import get_employee_subordinates, get_employee_tasks
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import condition
+
+from tasks.api import ApiError, ProjectResource, SprintResource, TaskResource, parse_limit
+from tasks.cache import OPTIONS_TIMEOUT, options_cache_key, options_etag
+from tasks.changes import read_changes
+from tasks.lib import get_employee_subordinates
 from tasks.models import Project
 
 
+def build_options(employee, project_id):
+    project = get_object_or_404(Project, id=project_id)
+    sprints = [(s.id, str(s)) for s in project.project_sprints.select_related('project')]
+    employees = [(e.id, str(e)) for e in project.employees.filter(
+        id__in=get_employee_subordinates(employee, include_self=False))]
+    tasks = [(t.id, str(t)) for t in project.project_tasks.visible_to(employee, include_self=False).select_related(
+        'project', 'employee')]
+    return [sprints, employees, tasks]
+
+
+@condition(etag_func=options_etag)
 def get_options(request):
     id = request.GET.get('id', '')
     if not id:
         result = [[], [], []]
     else:
-        project = Project.objects.get(id=id)
-        sprints = [(s.id, str(s)) for s in project.project_sprints.all()]
-        employees = [(e.id, str(e)) for e in get_employee_subordinates(request.user, include_self=False) if
-                     e in project.employees.all()]
-        project_tasks = project.project_tasks.all()
-        tasks = project_tasks.filter(
-            id__in=[task.id for task in get_employee_tasks(request.user, include_self=False)])
-        tasks = [(t.id, str(t)) for t in tasks]
-        result = [sprints, employees, tasks]
-    return HttpResponse(json.dumps(result), content_type="application/json")
\ No newline at end of file
+        key = options_cache_key(request, id)
+        result = cache.get(key)
+        if result is None:
+            result = build_options(request.user, id)
+            cache.set(key, result, OPTIONS_TIMEOUT)
+    response = HttpResponse(json.dumps(result), content_type="application/json")
+    patch_cache_control(response, private=True, max_age=0)
+    return response
+
+
+def api_response(read, *args):
+    try:
+        response = JsonResponse(read(*args))
+    except ApiError as e:
+        response = JsonResponse({'error': str(e)}, status=400)
+    patch_cache_control(response, private=True, max_age=0)
+    return response
+
+
+def api_view(read):
+    def view(request):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': "Authentication required"}, status=401)
+        return api_response(read, request.user, request.GET)
+    return view
+
+
+get_tasks = api_view(TaskResource().read)
+get_sprints = api_view(SprintResource().read)
+get_projects = api_view(ProjectResource().read)
+
+
+def read_feed(params):
+    return read_changes(params.get('since'), parse_limit(params.get('limit')))
+
+
+def get_changes(request):
+    # The feed has every row and is meant for mirror services, see tasks.changes.
+    token = settings.CHANGE_FEED_TOKEN
+    if not token or not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return JsonResponse({'error': "The change feed requires the CHANGE_FEED_TOKEN bearer token"}, status=403)
+    return api_response(read_feed, request.GET)